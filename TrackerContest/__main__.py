@@ -1,18 +1,110 @@
 import argparse
 
-from TrackerContest.app import TrackerContest
-
 
 parser = argparse.ArgumentParser()
 parser.add_argument("--window-width", help=f"Window width", type=int, default=1280)
 parser.add_argument("--window-height", help=f"Window height", type=int, default=720)
 parser.add_argument("--fullscreen", help="Fullscreen window", action="store_true", default=False)
+parser.add_argument("--max-ui-fps", help="UI redraw rate limit, 0 for none. The UI only redraws on input or "
+                                         "new frames", type=int, default=60)
+parser.add_argument("--tracker-backend", help="Tracker I/O backend", choices=["threads", "selector"],
+                    default="threads")
+parser.add_argument("--async-tracking", help="Do not wait for trackers before showing the next frame",
+                    action="store_true", default=False)
+parser.add_argument("--tracking-mode", help="lockstep: every tracker gets every frame, "
+                                            "realtime: slow trackers skip to the newest frame, "
+                                            "evaluations feed frames at the video frame rate",
+                    choices=["lockstep", "realtime"], default="lockstep")
+parser.add_argument("--tcp-address", help="Also accept trackers over TCP on host:port ([host]:port for IPv6). "
+                                         "Without a host only this machine can connect, 0.0.0.0:port listens "
+                                         "on every interface", default=None)
+parser.add_argument("--frame-cache", help="Directory caching decoded videos for later runs", default=None)
+parser.add_argument("--frame-cache-size", help="Frame cache size limit in GB", type=float, default=64)
+
+subparsers = parser.add_subparsers(dest="command")
+evaluate_parser = subparsers.add_parser("evaluate", help="Run the connected trackers on a video without GUI")
+evaluate_parser.add_argument("video", help="Video file or directory of frame images")
+evaluate_parser.add_argument("--bbox", help="Initial bbox x,y,w,h on the first frame", default=None)
+evaluate_parser.add_argument("--gt", help="Ground truth file, one x,y,w,h per frame", default=None)
+evaluate_parser.add_argument("--socket", help="Tracker server socket path", default="/tmp/server_socket")
+evaluate_parser.add_argument("--output", help="Results directory", default="results")
+evaluate_parser.add_argument("--trackers", help="Number of trackers to wait for (default: one per --tracker-cmd)",
+                             type=int, default=None)
+evaluate_parser.add_argument("--tracker-cmd", help="Tracker command to start, {socket} is the server socket path",
+                             action="append", default=[])
+evaluate_parser.add_argument("--connect-timeout", help="Seconds to wait for the trackers", type=float,
+                             default=60.0)
+evaluate_parser.add_argument("--decode-workers", help="Decode the video in this many processes, cut at keyframes",
+                             type=int, default=1)
+
+dataset_parser = subparsers.add_parser("dataset", help="Evaluate trackers on every sequence of a dataset")
+dataset_parser.add_argument("dataset", help="Directory of sequences: <name>/ with a video or frame images and groundtruth.txt, "
+                                            "or <name>.mp4 with <name>.txt")
+dataset_parser.add_argument("--tracker-cmd", help="Tracker command to start per sequence, "
+                                                  "{socket} is the server socket path",
+                            action="append", required=True)
+dataset_parser.add_argument("--output", help="Results directory", default="results")
+dataset_parser.add_argument("--workers", help="Sequences evaluated in parallel", type=int, default=None)
+dataset_parser.add_argument("--connect-timeout", help="Seconds to wait for the trackers", type=float,
+                            default=60.0)
 args = parser.parse_args()
 
+decoded_cache = None
+if args.frame_cache:
+    from TrackerContest.core.video import DecodedCache
+
+    decoded_cache = DecodedCache(args.frame_cache, int(args.frame_cache_size * (1 << 30)))
+
+
+if args.command == "evaluate":
+    # No GLFW/ImGui import: runs on machines without a display
+    from TrackerContest.evaluation import Evaluation
+
+    if args.bbox is None and args.gt is None:
+        parser.error("evaluate needs --bbox or --gt")
+
+    evaluation = Evaluation(
+        video_path=args.video,
+        output_dir=args.output,
+        init_bbox=tuple(float(v) for v in args.bbox.split(",")) if args.bbox else None,
+        gt_path=args.gt,
+        socket_path=args.socket,
+        tcp_address=args.tcp_address,
+        tracker_backend=args.tracker_backend,
+        n_trackers=args.trackers,
+        connect_timeout=args.connect_timeout,
+        tracker_commands=args.tracker_cmd,
+        decode_workers=args.decode_workers,
+        decoded_cache=decoded_cache,
+        tracking_mode=args.tracking_mode,
+        async_tracking=args.async_tracking)
+    evaluation.run()
+elif args.command == "dataset":
+    from TrackerContest.dataset import DatasetRunner
+
+    runner = DatasetRunner(
+        dataset_dir=args.dataset,
+        output_dir=args.output,
+        tracker_commands=args.tracker_cmd,
+        n_workers=args.workers,
+        tracker_backend=args.tracker_backend,
+        connect_timeout=args.connect_timeout,
+        decoded_cache=decoded_cache,
+        tracking_mode=args.tracking_mode,
+        async_tracking=args.async_tracking)
+    runner.run()
+else:
+    from TrackerContest.app import TrackerContest
 
-app = TrackerContest(
-    window_width=args.window_width,
-    window_height=args.window_height,
-    fullscreen=args.fullscreen)
+    app = TrackerContest(
+        window_width=args.window_width,
+        window_height=args.window_height,
+        fullscreen=args.fullscreen,
+        tracker_backend=args.tracker_backend,
+        async_tracking=args.async_tracking,
+        tracking_mode=args.tracking_mode,
+        tcp_address=args.tcp_address,
+        decoded_cache=decoded_cache,
+        max_ui_fps=args.max_ui_fps)
 
-app.run()
+    app.run()
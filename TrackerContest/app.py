@@ -9,11 +9,11 @@ import numpy as np
 
 from TrackerContest.core import Bus
 from TrackerContest.core.network import TrackerBroker
-from TrackerContest.core.video import VideoPlayer
+from TrackerContest.core.video import VideoPlayer, DecodedCache, FrameSlot
 from TrackerContest.gui import ImGuiApp
 from TrackerContest.gui.objects.windows.control_windows import ControlWindow
 from TrackerContest.gui.objects.windows.image_windows import ZoomImageWindow
-from TrackerContest.gui.utils import Drawer
+from TrackerContest.gui.utils import Drawer, DisplayProxy
 
 
 class States(Enum):
@@ -23,33 +23,70 @@ class States(Enum):
 
 
 class TrackerContest(ImGuiApp):
-    def __init__(self, window_width, window_height, fullscreen):
-        super().__init__(window_width, window_height, fullscreen)
+    def __init__(self, window_width, window_height, fullscreen, tracker_backend=TrackerBroker.BACKEND_THREADS,
+                 async_tracking=False, tracking_mode=TrackerBroker.MODE_LOCKSTEP, tcp_address=None,
+                 decoded_cache: Optional[DecodedCache] = None, max_ui_fps=60):
+        super().__init__(window_width, window_height, fullscreen, max_ui_fps)
 
         self._image_window = ZoomImageWindow()
         self._camera_window = ControlWindow(x=420, y=0)
 
-        self._frame: Optional[np.ndarray] = None
         self._nf = 0
+        # Inline on the decode thread on purpose: the player releases the pooled frame once publish returns, and
+        # lockstep tracking blocking here is what paces decoding to the slowest tracker
         Bus.subscribe("new-frame", self._new_frame)
+        Bus.subscribe("end-of-video", self._end_of_video)
 
         self._state: Optional[States] = States.PLAYING
 
-        self._video_player = VideoPlayer()
-        Bus.subscribe("init-video", self._video_player.init_video)
+        # Dispatch frames without waiting for replies, drawing the newest bbox each tracker has delivered
+        self._async_tracking = async_tracking or tracking_mode == TrackerBroker.MODE_REALTIME
+        self._last_frame_time: Optional[float] = None
+        self._loop_length: Optional[int] = None
 
-        self._tracker_broker = TrackerBroker()
+        self._video_player = VideoPlayer(policy=VideoPlayer.POLICY_DROP if self._async_tracking
+                                         else VideoPlayer.POLICY_SLOW_DOWN,
+                                         decoded_cache=decoded_cache)
+
+        # Frames to display, handed from the thread publishing them to the render loop. Info is
+        # (nf, overlay nf, latest): the frame number whose tracker bboxes are drawn over it, None to draw none
+        self._frame_slot = FrameSlot(self._video_player.frame_pool)
+        self._shown_generation = 0
+        self._shown_info: Optional[tuple] = None
+
+        # The texture gets the visible region of the frame at the size it is shown at, prepared off the
+        # render thread; trackers still get full resolution frames
+        self._display_proxy = DisplayProxy(self._video_player.frame_pool, on_result=self.request_redraw)
+        self._proxy_generation = 0
+        self._frame_size: Optional[tuple] = None
+        self._view: Optional[tuple] = None
+
+        Bus.subscribe("init-video", self._init_video)
+
+        self._tracker_broker = TrackerBroker(backend=tracker_backend, mode=tracking_mode, tcp_address=tcp_address,
+                                             frame_pool=self._video_player.frame_pool)
         self._tracker_broker.setup_server()
         Bus.subscribe("error-tracking", self._tracker_broker.remove_tracker)
 
     def _terminate(self):
         super()._terminate()
         self._video_player.stop()
+        Bus.unsubscribe("error-tracking", self._tracker_broker.remove_tracker)
         self._tracker_broker.close()
+        self._display_proxy.close()
+
+    def _init_video(self, file_path: str):
+        self._video_player.init_video(file_path)
+        self._tracker_broker.reserve_frames(self._video_player.frame_count + 1)
+        self._loop_length = None
 
     def _update(self):
         super()._update()
 
+    def _needs_redraw(self) -> bool:
+        # A frame not uploaded yet; frames arriving while the loop waits wake it through request_redraw
+        return self._video_player.on_playing and self._frame_slot.generation != self._shown_generation
+
     def draw_content(self):
         if self._video_player.on_playing:
             if self._state == States.PLAYING:
@@ -66,9 +103,25 @@ class TrackerContest(ImGuiApp):
                 self._keys_control_video()
                 self._keys_view_control()
 
-            if self._frame is not None:
-                self._image_window.upload_image(self._frame)
-
+            # Uploaded once per new frame, not once per UI frame, or again when zooming changed the visible region
+            frame, info, generation = self._frame_slot.get(self._shown_generation)
+            if frame is None and self._frame_size is not None and \
+                    self._image_window.display_view(*self._frame_size) != self._view:
+                frame, info, generation = self._frame_slot.get()
+            if frame is not None:
+                self._frame_size = (frame.shape[1], frame.shape[0])
+                self._view = self._image_window.display_view(*self._frame_size)
+                self._display_proxy.submit(frame, info, self._view)
+                self._shown_generation = generation
+
+            proxy, proxy_info, self._proxy_generation = self._display_proxy.get(self._proxy_generation)
+            if proxy is not None:
+                info, image_size, rect = proxy_info
+                self._image_window.upload_image(proxy, image_size, rect)
+                self._shown_info = info
+
+        # Looked up every UI frame: late results and draw mode changes show up without a new frame
+        self._image_window.set_bboxes(self._overlay_bboxes())
         self._image_window.draw()
         self._camera_window.draw()
 
@@ -97,14 +150,21 @@ class TrackerContest(ImGuiApp):
     def _keys_select_roi(self):
         if imgui.is_key_pressed(glfw.KEY_S):
             if self._tracker_broker.num_clients:
+                # Nothing shown yet: no frame to select on, playback goes on
+                frame, info, _ = self._frame_slot.get()
+                if frame is None:
+                    return
                 self._video_player.pause()
-                init_frame = self._frame.copy()
-                init_frame = cv2.cvtColor(init_frame, cv2.COLOR_RGB2BGR)
-                gt_bbox = Drawer.select_roi(init_frame,
-                                            window_name=VideoPlayer.ROI_SELECTION_WINDOW_NAME,
-                                            h=self._window_height,
-                                            w=self._window_width)
-                self._tracker_broker.init_all_tracker(self._frame, gt_bbox)
+                try:
+                    nf = info[0]
+                    init_frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+                    gt_bbox = Drawer.select_roi(init_frame,
+                                                window_name=VideoPlayer.ROI_SELECTION_WINDOW_NAME,
+                                                h=self._window_height,
+                                                w=self._window_width)
+                    self._tracker_broker.init_all_tracker(frame, gt_bbox, nf)
+                finally:
+                    self._frame_slot.release(frame)
                 self._state = States.TRACKING
                 self._video_player.start()
 
@@ -116,17 +176,48 @@ class TrackerContest(ImGuiApp):
         self._nf = nf
 
         if self._state == States.PLAYING:
-            self._frame = frame
+            self._show(frame)
 
         if self._state == States.TRACKING:
+            if self._async_tracking:
+                self._new_frame_async(frame, nf)
+                return
+
             t1 = time.time()
             self._tracker_broker.send_frame_all_clients(frame, nf)
-            all_bbox = self._tracker_broker.get_all_bbox(self._nf)
-            self._frame = Drawer.draw_bboxes(frame, all_bbox)
+            self._show(frame, overlay_nf=nf)
             t2 = time.time()
 
             Bus.publish("update-real-fps", int(1 / (t2 - t1)))
 
         if self._state == States.VIEWING:
-            all_bbox = self._tracker_broker.get_all_bbox(self._nf)
-            self._frame = Drawer.draw_bboxes(frame, all_bbox)
+            self._show(frame, overlay_nf=nf)
+
+    def _show(self, frame: np.ndarray, overlay_nf: Optional[int] = None, latest: bool = False):
+        self._frame_slot.put(frame, (self._nf, overlay_nf, latest))
+        self.request_redraw()
+
+    def _overlay_bboxes(self) -> list:
+        if self._shown_info is None or self._shown_info[1] is None:
+            return []
+        _, overlay_nf, latest = self._shown_info
+        return self._tracker_broker.get_all_labeled_bbox(overlay_nf, latest=latest)
+
+    def _new_frame_async(self, frame: np.ndarray, nf: int):
+        self._tracker_broker.send_frame_all_clients(frame, nf, wait=False)
+        # The newest bbox each tracker has delivered so far, trackers may still be reading the frame
+        self._show(frame, overlay_nf=nf, latest=True)
+
+        t = time.time()
+        if self._last_frame_time is not None and t > self._last_frame_time:
+            Bus.publish("update-real-fps", int(1 / (t - self._last_frame_time)))
+        self._last_frame_time = t
+
+    def _end_of_video(self, nf: int):
+        # nf of the first end is the frame count, frame numbers keep counting in later loops
+        if self._loop_length is None:
+            self._loop_length = nf
+            self._tracker_broker.set_loop_length(nf)
+        if self._state == States.TRACKING:
+            self._tracker_broker.flush()
+            self._last_frame_time = None
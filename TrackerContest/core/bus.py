@@ -1,6 +1,10 @@
+import collections
+import functools
 import logging
 import sys
-from typing import Dict, Callable
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Callable, List, Optional, Union
 
 _logger = logging.getLogger("Bus")
 _logger.setLevel(logging.DEBUG)
@@ -18,7 +22,23 @@ class EventNotExist(Exception):
     pass
 
 
+class Subscription:
+    def __init__(self, callback: Callable, policy: str, coalesce: Union[bool, Callable]):
+        self.callback = callback
+        self.policy = policy
+        # Coalesced: deliveries not made yet are replaced by newer ones, per key computed from the arguments
+        self.coalesce = coalesce
+        self.pending: Dict = {}
+
+
 class Bus:
+    # Delivery policies: in the publishing thread, in a worker pool, or in the GUI thread when it calls
+    # dispatch_gui() once per UI frame
+    INLINE = "inline"
+    POOL = "pool"
+    GUI = "gui"
+    POOL_WORKERS = 4
+
     __instance = None
 
     @staticmethod
@@ -33,29 +53,112 @@ class Bus:
         else:
             Bus.__instance = self
 
-        self.subscribers: Dict[str, Callable] = dict()
+        self.subscribers: Dict[str, List[Subscription]] = dict()
+        self._lock = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._gui_queue = collections.deque()
+        self._gui_wakeup: Optional[Callable] = None
 
     @staticmethod
-    def subscribe(event_name: str, callback: Callable):
+    def subscribe(event_name: str, callback: Callable, policy: str = INLINE, coalesce: Union[bool, Callable] = False):
+        # Any number of callbacks per event; coalesce=True keeps only the latest pending delivery, a callable
+        # keeps the latest one per key it returns for the event arguments (e.g. per tracker name)
         bus = Bus.instance()
 
-        if event_name not in bus.subscribers:
-            bus.subscribers[event_name] = callback
-            _logger.debug(f"Added listener to {event_name} event")
-        else:
-            raise EventAlreadyExists(f"Event {event_name} already exist")
+        with bus._lock:
+            subscriptions = bus.subscribers.setdefault(event_name, [])
+            if any(subscription.callback == callback for subscription in subscriptions):
+                raise EventAlreadyExists(f"Callback already subscribed to event {event_name}")
+            subscriptions.append(Subscription(callback, policy, coalesce))
+        _logger.debug(f"Added listener to {event_name} event")
+
+    @staticmethod
+    def unsubscribe(event_name: str, callback: Callable):
+        bus = Bus.instance()
+
+        with bus._lock:
+            subscriptions = bus.subscribers.get(event_name, [])
+            remaining = [subscription for subscription in subscriptions if subscription.callback != callback]
+            if len(remaining) == len(subscriptions):
+                raise EventNotExist(f"Callback not subscribed to event {event_name}")
+            if remaining:
+                bus.subscribers[event_name] = remaining
+            else:
+                bus.subscribers.pop(event_name)
+        _logger.debug(f"Removed listener from {event_name} event")
 
     @staticmethod
     def publish(event_name: str, *args, **kwargs):
+        # Returns what the last inline subscriber returned
         bus = Bus.instance()
 
-        if event_name in bus.subscribers:
-            _logger.debug(f"Emit event {event_name}")
-            if callable(bus.subscribers[event_name]):
-                res = bus.subscribers[event_name](*args, **kwargs)
-                return res
+        with bus._lock:
+            subscriptions = list(bus.subscribers.get(event_name, ()))
+        if not subscriptions:
+            return None
+
+        _logger.debug(f"Emit event {event_name}")
+        res = None
+        for subscription in subscriptions:
+            if subscription.policy == Bus.INLINE:
+                if callable(subscription.callback):
+                    res = subscription.callback(*args, **kwargs)
+                else:
+                    res = subscription.callback
             else:
-                return bus.subscribers[event_name]
+                bus._schedule(subscription, args, kwargs)
+        return res
 
+    @staticmethod
+    def set_gui_wakeup(wakeup: Optional[Callable]):
+        # Called, from any thread, when a GUI delivery is queued, so an idle render loop wakes up for it
+        Bus.instance()._gui_wakeup = wakeup
+
+    @staticmethod
+    def dispatch_gui():
+        # Runs the GUI deliveries queued so far, in the calling thread
+        bus = Bus.instance()
+
+        with bus._lock:
+            tasks = list(bus._gui_queue)
+            bus._gui_queue.clear()
+        for task in tasks:
+            Bus._run(task)
+
+    def _schedule(self, subscription: Subscription, args: tuple, kwargs: dict):
+        if subscription.coalesce:
+            key = subscription.coalesce(*args, **kwargs) if callable(subscription.coalesce) else None
+            with self._lock:
+                scheduled = bool(subscription.pending)
+                subscription.pending[key] = (args, kwargs)
+            if scheduled:
+                return
+            task = functools.partial(self._deliver_pending, subscription)
         else:
-            EventNotExist(f"Even {event_name} not exist")
+            task = functools.partial(subscription.callback, *args, **kwargs)
+
+        if subscription.policy == Bus.POOL:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=Bus.POOL_WORKERS, thread_name_prefix="Bus")
+            self._pool.submit(Bus._run, task)
+        else:
+            with self._lock:
+                self._gui_queue.append(task)
+            if self._gui_wakeup is not None:
+                self._gui_wakeup()
+
+    def _deliver_pending(self, subscription: Subscription):
+        with self._lock:
+            pending = list(subscription.pending.values())
+            subscription.pending.clear()
+        for args, kwargs in pending:
+            subscription.callback(*args, **kwargs)
+
+    @staticmethod
+    def _run(task: Callable):
+        # Deferred deliveries have no publisher to raise to
+        try:
+            task()
+        except Exception:
+            _logger.exception("Event callback failed")
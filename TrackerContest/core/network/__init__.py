@@ -1,2 +1,7 @@
 from .tracker_broker import TrackerBroker
 from .tracker_client import TrackerClient
+from .loop_tracker_client import LoopTrackerClient
+from .protocol import MessageSocket, MessageType, ProtocolError
+from .frame_ring import FrameRing, SharedFrameReader
+from .frame_packet import FramePacket
+from .frame_spec import FrameSpec, FrameTransform
@@ -0,0 +1,101 @@
+import collections
+import selectors
+import socket
+import threading
+from typing import Callable, Optional, List
+
+
+class TrackerEventLoop:
+    def __init__(self, server_sockets: List[socket.socket], on_accept: Callable):
+        self._server_sockets = server_sockets
+        self._on_accept = on_accept
+
+        self._selector = selectors.DefaultSelector()
+        self._wakeup_reader, self._wakeup_writer = socket.socketpair()
+        self._wakeup_reader.setblocking(False)
+        self._wakeup_writer.setblocking(False)
+
+        self._calls = collections.deque()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def in_loop_thread(self) -> bool:
+        return threading.current_thread() is self._thread
+
+    def start(self):
+        for server_socket in self._server_sockets:
+            server_socket.setblocking(False)
+            self._selector.register(server_socket, selectors.EVENT_READ, self._accept)
+        self._selector.register(self._wakeup_reader, selectors.EVENT_READ, self._run_calls)
+
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True, name="TrackerEventLoop")
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._wakeup()
+        if self._thread is not None and not self.in_loop_thread:
+            self._thread.join()
+
+    def call_soon(self, callback: Callable, *args):
+        # Thread-safe: schedules callback on the loop thread
+        self._calls.append((callback, args))
+        self._wakeup()
+
+    def register(self, sock: socket.socket, handler: Callable):
+        self._selector.register(sock, selectors.EVENT_READ, handler)
+
+    def set_writing(self, sock: socket.socket, writing: bool):
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if writing else 0)
+        key = self._selector.get_key(sock)
+        if key.events != events:
+            self._selector.modify(sock, events, key.data)
+
+    def unregister(self, sock: socket.socket):
+        try:
+            self._selector.unregister(sock)
+        except (KeyError, ValueError):
+            pass
+
+    def _run(self):
+        while self._running:
+            for key, mask in self._selector.select(timeout=1):
+                try:
+                    key.data(key.fileobj, mask)
+                except Exception as e:
+                    print("[ERROR] Event loop error: ", e)
+
+        self._selector.close()
+        self._wakeup_reader.close()
+        self._wakeup_writer.close()
+
+    def _wakeup(self):
+        try:
+            self._wakeup_writer.send(b"\0")
+        except (BlockingIOError, OSError):
+            pass
+
+    def _run_calls(self, sock: socket.socket, mask: int):
+        try:
+            while sock.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+
+        while self._calls:
+            callback, args = self._calls.popleft()
+            try:
+                callback(*args)
+            except Exception as e:
+                print("[ERROR] Event loop error: ", e)
+
+    def _accept(self, sock: socket.socket, mask: int):
+        while True:
+            try:
+                client_socket, address = sock.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            client_socket.setblocking(False)
+            self._on_accept(client_socket, address)
@@ -0,0 +1,101 @@
+import threading
+from typing import Optional, Dict, Callable, Tuple
+
+import cv2
+import numpy as np
+
+from TrackerContest.core.network.frame_ring import FrameRing
+from TrackerContest.core.network.frame_spec import FrameSpec, FrameTransform
+from TrackerContest.core.network.protocol import MessageType, pack_frame, pack_raw_frame, pack_image_frame
+
+
+class FramePacket:
+    # A frame encoded at most once per (variant, encoding), the resulting buffers are shared by every client
+    ENCODING_MSGPACK = "msgpack"
+    ENCODING_RAW = "raw"
+    ENCODING_SHM = "shm"
+    ENCODING_PNG = "png"
+    ENCODING_JPEG = "jpeg"
+
+    def __init__(self, frame: np.ndarray, nf: int, slot: Optional[int] = None,
+                 frame_ring: Optional[FrameRing] = None, on_release: Optional[Callable] = None):
+        self._frame = frame
+        self._nf = nf
+        self._slot = slot
+        self._frame_ring = frame_ring
+
+        # Jobs still reading the frame, on_release(frame) runs when the last one is done
+        self._holders = 0
+        self._on_release = on_release
+
+        self._variants: Dict[tuple, Tuple[np.ndarray, FrameTransform]] = {}
+        self._messages: Dict[tuple, tuple] = {}
+        self._lock = threading.Lock()
+        self._key_locks: Dict[tuple, threading.Lock] = {}
+
+    @property
+    def frame(self) -> np.ndarray:
+        return self._frame
+
+    @property
+    def nf(self) -> int:
+        return self._nf
+
+    @property
+    def slot(self) -> Optional[int]:
+        return self._slot
+
+    def hold(self, n: int = 1):
+        with self._lock:
+            self._holders += n
+
+    def release(self):
+        with self._lock:
+            if self._holders <= 0:
+                return
+            self._holders -= 1
+            if self._holders > 0 or self._on_release is None:
+                return
+        self._on_release(self._frame)
+
+    def variant(self, spec: Optional[FrameSpec] = None, crop: Optional[tuple] = None) \
+            -> Tuple[np.ndarray, FrameTransform]:
+        if spec is None or (spec.is_identity and crop is None):
+            return self._frame, FrameTransform()
+        return self._once(self._variants, ("variant", spec.variant_key(crop)), lambda: spec.apply(self._frame, crop))
+
+    def message(self, encoding: str, spec: Optional[FrameSpec] = None, crop: Optional[tuple] = None) \
+            -> Tuple[tuple, FrameTransform]:
+        # ((message type, *payload buffers), transform of the sent variant)
+        frame, transform = self.variant(spec, crop)
+        key = (encoding, spec.variant_key(crop) if frame is not self._frame else None)
+        colorspace = spec.colorspace if key[1] is not None else FrameSpec.COLOR_RGB
+        return self._once(self._messages, key, lambda: self._encode(encoding, frame, key[1] is None, colorspace)), \
+            transform
+
+    def _once(self, cache: dict, key: tuple, compute: Callable):
+        # Different keys are computed in parallel, the same key only once
+        with self._lock:
+            if key in cache:
+                return cache[key]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            if key not in cache:
+                cache[key] = compute()
+            return cache[key]
+
+    def _encode(self, encoding: str, frame: np.ndarray, full_frame: bool,
+                colorspace: str = FrameSpec.COLOR_RGB) -> tuple:
+        if encoding == FramePacket.ENCODING_SHM and full_frame and self._slot is not None:
+            return MessageType.FRAME_SHM, self._frame_ring.describe(self._slot)
+        if encoding == FramePacket.ENCODING_RAW and frame.dtype == np.uint8:
+            return (MessageType.FRAME_RAW, *pack_raw_frame(frame))
+        if encoding == FramePacket.ENCODING_PNG:
+            return MessageType.FRAME_IMAGE, pack_image_frame(frame, ".png", colorspace=colorspace)
+        if encoding.startswith(FramePacket.ENCODING_JPEG):
+            # "jpeg:<quality>"
+            quality = int(encoding.partition(":")[2] or 90)
+            return MessageType.FRAME_IMAGE, pack_image_frame(frame, ".jpg", (cv2.IMWRITE_JPEG_QUALITY, quality),
+                                                              colorspace)
+        return MessageType.FRAME, pack_frame(frame)
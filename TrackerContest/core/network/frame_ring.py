@@ -0,0 +1,102 @@
+import threading
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Optional, List, Dict
+
+import numpy as np
+
+from TrackerContest.core.network.protocol import pack_object, unpack_object
+
+
+class FrameRing:
+    def __init__(self, n_slots: int = 8):
+        self._n_slots = n_slots
+        self._slot_size = 0
+        self._shm: Optional[SharedMemory] = None
+
+        self._refs: List[int] = [0] * n_slots
+        self._descriptors: List[bytes] = [b""] * n_slots
+        self._next_slot = 0
+
+        self._cond = threading.Condition()
+
+    @property
+    def name(self) -> Optional[str]:
+        return self._shm.name if self._shm is not None else None
+
+    @property
+    def n_slots(self) -> int:
+        return self._n_slots
+
+    def write(self, frame: np.ndarray, holders: int) -> int:
+        with self._cond:
+            if frame.nbytes > self._slot_size:
+                self._cond.wait_for(lambda: not any(self._refs))
+                self._allocate(frame.nbytes)
+
+            self._cond.wait_for(lambda: not all(self._refs))
+            slot = self._next_slot
+            while self._refs[slot]:
+                slot = (slot + 1) % self._n_slots
+            self._next_slot = (slot + 1) % self._n_slots
+            self._refs[slot] = holders
+
+        offset = slot * self._slot_size
+        view = np.ndarray(frame.shape, dtype=frame.dtype, buffer=self._shm.buf, offset=offset)
+        view[...] = frame
+
+        self._descriptors[slot] = pack_object({"shm": self._shm.name, "slot": slot, "offset": offset,
+                                               "shape": frame.shape, "dtype": frame.dtype.str})
+        return slot
+
+    def describe(self, slot: int) -> bytes:
+        return self._descriptors[slot]
+
+    def release(self, slot: int):
+        with self._cond:
+            self._refs[slot] -= 1
+            self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self._free()
+
+    def _allocate(self, slot_size: int):
+        self._free()
+        self._slot_size = slot_size
+        self._shm = SharedMemory(create=True, size=slot_size * self._n_slots)
+        self._next_slot = 0
+
+    def _free(self):
+        if self._shm is None:
+            return
+        self._shm.close()
+        try:
+            self._shm.unlink()
+        except FileNotFoundError:
+            pass
+        self._shm = None
+        self._slot_size = 0
+
+
+class SharedFrameReader:
+    # Tracker side counterpart of FrameRing: maps a FRAME_SHM payload to an array without copying
+    def __init__(self):
+        self._segments: Dict[str, SharedMemory] = {}
+
+    def read(self, payload) -> np.ndarray:
+        descriptor = unpack_object(payload)
+        name = descriptor["shm"]
+        if name not in self._segments:
+            self.close()
+            shm = SharedMemory(name=name)
+            # The broker owns the segment, do not let this process unlink it on exit
+            resource_tracker.unregister(shm._name, "shared_memory")
+            self._segments[name] = shm
+        return np.ndarray(descriptor["shape"], dtype=np.dtype(descriptor["dtype"]),
+                          buffer=self._segments[name].buf, offset=descriptor["offset"])
+
+    def close(self):
+        for shm in self._segments.values():
+            shm.close()
+        self._segments.clear()
@@ -0,0 +1,108 @@
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+
+class FrameTransform:
+    # Maps bboxes between a frame variant and the full frame: full = variant / scale + offset
+    def __init__(self, offset_x: int = 0, offset_y: int = 0, scale: float = 1.0):
+        self._offset_x = offset_x
+        self._offset_y = offset_y
+        self._scale = scale
+
+    @property
+    def is_identity(self) -> bool:
+        return self._offset_x == 0 and self._offset_y == 0 and self._scale == 1.0
+
+    def to_frame(self, bbox):
+        if bbox is None or self.is_identity:
+            return bbox
+        x, y, w, h = bbox[:4]
+        return (x / self._scale + self._offset_x, y / self._scale + self._offset_y,
+                w / self._scale, h / self._scale)
+
+    def to_variant(self, bbox):
+        if bbox is None or self.is_identity:
+            return bbox
+        x, y, w, h = bbox[:4]
+        return ((x - self._offset_x) * self._scale, (y - self._offset_y) * self._scale,
+                w * self._scale, h * self._scale)
+
+
+class FrameSpec:
+    # Input a tracker asks for in its HELLO: max_size, colorspace and crop_margin
+    COLOR_RGB = "rgb"
+    COLOR_BGR = "bgr"
+    COLOR_GRAY = "gray"
+
+    _CONVERSIONS = {COLOR_BGR: cv2.COLOR_RGB2BGR, COLOR_GRAY: cv2.COLOR_RGB2GRAY}
+
+    def __init__(self, max_size: Optional[Tuple[int, int]] = None, colorspace: str = COLOR_RGB,
+                 crop_margin: Optional[float] = None):
+        self._max_size = max_size
+        self._colorspace = colorspace if colorspace in (FrameSpec.COLOR_BGR, FrameSpec.COLOR_GRAY) \
+            else FrameSpec.COLOR_RGB
+        self._crop_margin = crop_margin
+
+    @staticmethod
+    def from_info(info: dict):
+        max_size = info.get("max_size")
+        if isinstance(max_size, (int, float)):
+            max_size = (int(max_size), int(max_size))
+        elif max_size is not None:
+            max_size = (int(max_size[0]), int(max_size[1]))
+        crop_margin = info.get("crop_margin")
+        return FrameSpec(max_size, str(info.get("colorspace", FrameSpec.COLOR_RGB)).lower(),
+                         float(crop_margin) if crop_margin is not None else None)
+
+    @property
+    def is_identity(self) -> bool:
+        return self._max_size is None and self._colorspace == FrameSpec.COLOR_RGB and self._crop_margin is None
+
+    @property
+    def colorspace(self) -> str:
+        return self._colorspace
+
+    @property
+    def crops(self) -> bool:
+        return self._crop_margin is not None
+
+    def crop_region(self, bbox, frame_shape: tuple) -> Optional[Tuple[int, int, int, int]]:
+        # Search window around the last bbox: the bbox grown by crop_margin of its size on every side
+        if self._crop_margin is None or bbox is None:
+            return None
+        frame_height, frame_width = frame_shape[:2]
+        x, y, w, h = bbox[:4]
+        if w <= 0 or h <= 0:
+            return None
+        x0 = int(max(0, np.floor(x - self._crop_margin * w)))
+        y0 = int(max(0, np.floor(y - self._crop_margin * h)))
+        x1 = int(min(frame_width, np.ceil(x + w + self._crop_margin * w)))
+        y1 = int(min(frame_height, np.ceil(y + h + self._crop_margin * h)))
+        if x1 <= x0 or y1 <= y0:
+            return None
+        return x0, y0, x1, y1
+
+    def variant_key(self, crop: Optional[tuple]) -> tuple:
+        # Trackers with equal keys share one variant of a frame
+        return self._max_size, self._colorspace, crop
+
+    def apply(self, frame: np.ndarray, crop: Optional[tuple]) -> Tuple[np.ndarray, FrameTransform]:
+        offset_x, offset_y = 0, 0
+        if crop is not None:
+            offset_x, offset_y, x1, y1 = crop
+            frame = frame[offset_y:y1, offset_x:x1]
+
+        scale = 1.0
+        if self._max_size is not None:
+            height, width = frame.shape[:2]
+            scale = min(1.0, self._max_size[0] / width, self._max_size[1] / height)
+            if scale < 1.0:
+                size = (max(1, round(width * scale)), max(1, round(height * scale)))
+                frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+        if self._colorspace in FrameSpec._CONVERSIONS:
+            frame = cv2.cvtColor(frame, FrameSpec._CONVERSIONS[self._colorspace])
+
+        return np.ascontiguousarray(frame), FrameTransform(offset_x, offset_y, scale)
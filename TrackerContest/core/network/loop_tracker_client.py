@@ -0,0 +1,162 @@
+import collections
+import functools
+import selectors
+import socket
+from concurrent.futures import Future
+from typing import Optional, Callable
+
+import numpy as np
+
+from TrackerContest.core import Bus
+from TrackerContest.core.network.event_loop import TrackerEventLoop
+from TrackerContest.core.network.frame_packet import FramePacket
+from TrackerContest.core.network.frame_ring import FrameRing
+from TrackerContest.core.network.protocol import MessageReader, MessageWriter, MessageType, ProtocolError, \
+    unpack_object, NO_FRAME
+from TrackerContest.core.network.tracker_client import TrackerClient
+from TrackerContest.core.results import ResultsStore
+
+
+class LoopTrackerClient(TrackerClient):
+    # Non-blocking TrackerClient driven by a shared TrackerEventLoop instead of its own worker thread
+    def __init__(self, client_socket: socket.socket, event_loop: TrackerEventLoop, on_meeting: Callable,
+                 frame_ring: Optional[FrameRing] = None, results_store: Optional[ResultsStore] = None):
+        super().__init__(client_socket, frame_ring, results_store)
+
+        self._socket = client_socket
+        self._event_loop = event_loop
+        self._on_meeting = on_meeting
+
+        self._reader = MessageReader()
+        self._writer = MessageWriter()
+        # Requests waiting for their reply, in send order: (expected type, nf, handler, future)
+        self._requests = collections.deque()
+        # Track jobs of a tracker with a search window, held back until the reply before them is in
+        self._held = collections.deque()
+        self._met = False
+
+    def first_meeting(self):
+        self._event_loop.register(self._socket, self._handle_events)
+
+    def start_track(self, packet: FramePacket) -> Future:
+        future = Future()
+        if self._closed:
+            TrackerClient._cancel(future)
+        else:
+            self._event_loop.call_soon(self._send_track, packet, future)
+        return self._hold_slot(packet, future)
+
+    def start_init(self, frame: np.ndarray, gt_bbox: tuple, nf: int = NO_FRAME) -> Future:
+        self._on_init(gt_bbox, nf)
+        return self._request(MessageType.ACK, None, MessageType.INIT, self._init_payload(frame, gt_bbox),
+                             nf=nf)
+
+    def stop_tracking(self) -> Future:
+        return self._request(MessageType.ACK, None, MessageType.STOP)
+
+    def close(self):
+        self._closed = True
+        self._event_loop.call_soon(self._shutdown)
+
+    def _request(self, expected: MessageType, handler: Optional[Callable], msg_type: MessageType, *payload,
+                 nf: int = NO_FRAME) -> Future:
+        future = Future()
+        if self._closed:
+            TrackerClient._cancel(future)
+        else:
+            self._event_loop.call_soon(self._send, (expected, nf, handler, future), msg_type, nf, payload)
+        return future
+
+    def _send(self, request: tuple, msg_type: MessageType, nf: int, payload: tuple):
+        future = request[3]
+        if self._closed:
+            future.cancel()
+        if not future.set_running_or_notify_cancel():
+            return
+
+        self._requests.append(request)
+        self._writer.append(msg_type, nf, *payload)
+        self._flush()
+
+    def _send_track(self, packet: FramePacket, future: Future):
+        # The frame message is built when sent: a search window is cropped around the reply to the previous frame
+        if self._spec.crops and (self._requests or self._held) and not self._closed:
+            self._held.append((packet, future))
+            return
+        self._send_frame(packet, future)
+
+    def _send_frame(self, packet: FramePacket, future: Future):
+        try:
+            message, transform = self._frame_message(packet)
+        except Exception as e:
+            if future.set_running_or_notify_cancel():
+                future.set_exception(e)
+            return
+        handler = functools.partial(self._on_bbox, transform=transform)
+        self._send((MessageType.BBOX, packet.nf, handler, future), message[0], packet.nf, message[1:])
+
+    def _send_held(self):
+        while self._held and not self._requests:
+            self._send_frame(*self._held.popleft())
+
+    def _flush(self):
+        try:
+            done = self._writer.write_to(self._socket)
+        except OSError as e:
+            self._fail(e)
+            return
+        self._event_loop.set_writing(self._socket, not done)
+
+    def _handle_events(self, sock: socket.socket, mask: int):
+        if mask & selectors.EVENT_WRITE:
+            self._flush()
+        if mask & selectors.EVENT_READ and not self._closed:
+            try:
+                while (message := self._reader.read_from(sock)) is not None:
+                    self._dispatch(*message)
+            except (OSError, ProtocolError) as e:
+                self._fail(e)
+
+    def _dispatch(self, msg_type: MessageType, reply_nf: int, payload: memoryview):
+        if not self._met:
+            if msg_type != MessageType.HELLO:
+                raise ProtocolError(f"Expected HELLO, got {msg_type.name}")
+            self._on_hello(unpack_object(payload))
+            self._writer.append(MessageType.ACK)
+            self._flush()
+            if self._closed:
+                return
+            self._met = True
+            self._on_meeting(self)
+            return
+
+        if not self._requests:
+            raise ProtocolError(f"Unexpected {msg_type.name} from {self.name}")
+
+        expected, nf, handler, future = self._requests.popleft()
+        if msg_type != expected:
+            future.set_exception(ProtocolError(f"Expected {expected.name}, got {msg_type.name}"))
+        else:
+            try:
+                future.set_result(handler(nf, reply_nf, payload) if handler is not None else None)
+            except Exception as e:
+                print(f"[Error] Failed reply ({self.name}): {e}")
+                future.set_exception(e)
+        self._send_held()
+
+    def _fail(self, error: Exception):
+        if self._closed:
+            return
+        print(f"[Error] Connection lost ({self.name}): {error}")
+        self._shutdown()
+        if self._met:
+            Bus.publish("error-tracking", self._name)
+
+    def _shutdown(self):
+        self._closed = True
+        self._event_loop.unregister(self._socket)
+        self._socket.close()
+        while self._requests:
+            self._requests.popleft()[3].set_exception(ConnectionResetError(f"{self.name} disconnected"))
+        while self._held:
+            TrackerClient._cancel(self._held.popleft()[1])
@@ -0,0 +1,271 @@
+import collections
+import enum
+import itertools
+import socket
+import struct
+from typing import Tuple, Optional
+
+import cv2
+import msgpack
+import msgpack_numpy as mp
+import numpy as np
+
+# Every message on a tracker socket is a fixed size header followed by `length` bytes of payload:
+#   magic (2s) | version (B) | message type (B) | frame number (q) | payload length (Q)
+# Session flow:
+#   tracker -> HELLO {name, color, transport, encoding,    broker -> ACK
+#                     max_size, colorspace, crop_margin,
+#                     compression, jpeg_quality}
+#   broker  -> INIT  {frame, bbox}                         tracker -> ACK
+#   broker  -> FRAME frame                                 tracker -> BBOX {bbox, fps}
+#   broker  -> FRAME_SHM {shm, slot, offset, shape, dtype} tracker -> BBOX {bbox, fps}
+#   broker  -> FRAME_RAW height, width, channels | pixels  tracker -> BBOX {bbox, fps}
+#   broker  -> FRAME_IMAGE png / jpeg bytes                tracker -> BBOX {bbox, fps}
+#   broker  -> STOP                                        tracker -> ACK
+# Trackers announcing transport "shm" get FRAME_SHM instead of FRAME. The shared memory slot stays valid
+# until the tracker sends its BBOX reply for that frame.
+# Trackers announcing encoding "raw" get uint8 frames as FRAME_RAW: a RAW_META struct followed by the pixels.
+# Compression "png" and "jpeg" (with jpeg_quality) send cv2.imencode output as FRAME_IMAGE, meant for TCP trackers.
+# The image holds the true colours, cv2.imdecode returns them as BGR: unpack_image_frame with the colorspace asked
+# for gives back that channel order.
+# max_size (side or (width, height)), colorspace ("rgb", "bgr", "gray") and crop_margin (search window around the
+# last bbox, as a fraction of its size) select the variant of the frame a tracker receives, INIT included.
+# Bboxes are exchanged in the coordinates of that variant, the broker maps them back to the full frame.
+# Control payloads ({...} above) are plain msgpack maps: trackers may connect over TCP, nothing they send is
+# unpickled. Tuples arrive as lists, numpy values as lists or scalars.
+PROTOCOL_MAGIC = b"TC"
+PROTOCOL_VERSION = 2
+
+HEADER = struct.Struct("!2sBBqQ")
+RAW_META = struct.Struct("!III")
+
+# Upper bound of buffers handed to a single sendmsg call (IOV_MAX is 1024 on Linux)
+MAX_IOV = 64
+
+NO_FRAME = -1
+
+
+class MessageType(enum.IntEnum):
+    HELLO = 1
+    ACK = 2
+    INIT = 3
+    FRAME = 4
+    BBOX = 5
+    STOP = 6
+    FRAME_SHM = 7
+    FRAME_RAW = 8
+    FRAME_IMAGE = 9
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def pack_header(msg_type: MessageType, nf: int, length: int) -> bytes:
+    return HEADER.pack(PROTOCOL_MAGIC, PROTOCOL_VERSION, msg_type, nf, length)
+
+
+def unpack_header(header) -> Tuple[MessageType, int, int]:
+    magic, version, msg_type, nf, length = HEADER.unpack(header)
+    if magic != PROTOCOL_MAGIC:
+        raise ProtocolError(f"Bad magic {magic!r}")
+    if version != PROTOCOL_VERSION:
+        raise ProtocolError(f"Unsupported protocol version {version} (expected {PROTOCOL_VERSION})")
+    try:
+        return MessageType(msg_type), nf, length
+    except ValueError:
+        raise ProtocolError(f"Unknown message type {msg_type}")
+
+
+def pack_object(obj) -> bytes:
+    return msgpack.packb(obj, default=_plain)
+
+
+def unpack_object(payload):
+    return msgpack.unpackb(payload)
+
+
+def _plain(obj):
+    # numpy values trackers tend to put in their replies
+    if isinstance(obj, (np.ndarray, np.generic)):
+        return obj.tolist()
+    raise TypeError(f"Cannot pack {type(obj).__name__}")
+
+
+def pack_frame(frame: np.ndarray) -> bytes:
+    return mp.packb(frame, default=mp.encode)
+
+
+def unpack_frame(payload) -> np.ndarray:
+    return mp.unpackb(payload, object_hook=mp.decode)
+
+
+def pack_raw_frame(frame: np.ndarray) -> tuple:
+    # Zero copy: the pixels are sent straight from the array buffer
+    frame = np.ascontiguousarray(frame)
+    channels = frame.shape[2] if frame.ndim == 3 else 1
+    return RAW_META.pack(frame.shape[0], frame.shape[1], channels), frame.data
+
+
+def unpack_raw_frame(payload) -> np.ndarray:
+    height, width, channels = RAW_META.unpack_from(payload)
+    frame = np.frombuffer(payload, dtype=np.uint8, offset=RAW_META.size)
+    return frame.reshape((height, width, channels) if channels > 1 else (height, width))
+
+
+def pack_image_frame(frame: np.ndarray, extension: str, params: tuple = (), colorspace: str = "rgb") -> bytes:
+    # cv2.imencode takes BGR: JPEG chroma subsampling works on the wrong channels of an RGB frame
+    if colorspace == "rgb" and frame.ndim == 3 and frame.shape[2] == 3:
+        frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+    ok, encoded = cv2.imencode(extension, frame, list(params))
+    if not ok:
+        raise ValueError(f"Could not encode frame as {extension}")
+    return encoded.data
+
+
+def unpack_image_frame(payload, colorspace: str = "rgb") -> np.ndarray:
+    frame = cv2.imdecode(np.frombuffer(payload, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    if colorspace == "rgb" and frame.ndim == 3 and frame.shape[2] == 3:
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    return frame
+
+
+def pack_init(frame: np.ndarray, bbox: tuple) -> bytes:
+    return mp.packb({"frame": frame, "bbox": list(bbox)}, default=mp.encode)
+
+
+def unpack_init(payload) -> Tuple[np.ndarray, tuple]:
+    data = mp.unpackb(payload, object_hook=mp.decode)
+    return data["frame"], tuple(data["bbox"])
+
+
+class MessageSocket:
+    def __init__(self, sock: socket.socket, buffer_size: int = 1 << 20):
+        self._socket = sock
+        self._header_buffer = bytearray(HEADER.size)
+        self._payload_buffer = bytearray(buffer_size)
+
+    @property
+    def socket(self) -> socket.socket:
+        return self._socket
+
+    def send(self, msg_type: MessageType, nf: int = NO_FRAME, *payload):
+        length = sum(memoryview(part).nbytes for part in payload)
+        self.send_buffers([pack_header(msg_type, nf, length), *payload])
+
+    def send_buffers(self, buffers):
+        views = collections.deque(_as_views(buffers))
+        while views:
+            _advance(views, self._socket.sendmsg(list(itertools.islice(views, MAX_IOV))))
+
+    def receive(self) -> Tuple[MessageType, int, memoryview]:
+        # Returned payload points into the internal buffer and is valid until the next receive
+        self._receive_into(memoryview(self._header_buffer))
+        msg_type, nf, length = unpack_header(self._header_buffer)
+
+        if length > len(self._payload_buffer):
+            self._payload_buffer = bytearray(length)
+
+        payload = memoryview(self._payload_buffer)[:length]
+        self._receive_into(payload)
+
+        return msg_type, nf, payload
+
+    def expect(self, expected: MessageType) -> Tuple[int, memoryview]:
+        msg_type, nf, payload = self.receive()
+        if msg_type != expected:
+            raise ProtocolError(f"Expected {expected.name}, got {msg_type.name}")
+        return nf, payload
+
+    def close(self):
+        self._socket.close()
+
+    def _receive_into(self, view: memoryview):
+        received = 0
+        while received < view.nbytes:
+            n = self._socket.recv_into(view[received:])
+            if n == 0:
+                raise ConnectionResetError("Connection closed by peer")
+            received += n
+
+
+class MessageReader:
+    # Incremental message parser for non-blocking sockets
+    def __init__(self, buffer_size: int = 1 << 20):
+        self._header_buffer = bytearray(HEADER.size)
+        self._payload_buffer = bytearray(buffer_size)
+
+        self._message: Optional[Tuple[MessageType, int]] = None
+        self._target = memoryview(self._header_buffer)
+        self._received = 0
+
+    def read_from(self, sock: socket.socket) -> Optional[Tuple[MessageType, int, memoryview]]:
+        # Returns None when the socket has no more data; payload is valid until the next call
+        while True:
+            if self._received < self._target.nbytes:
+                try:
+                    n = sock.recv_into(self._target[self._received:])
+                except (BlockingIOError, InterruptedError):
+                    return None
+                if n == 0:
+                    raise ConnectionResetError("Connection closed by peer")
+                self._received += n
+                if self._received < self._target.nbytes:
+                    continue
+
+            if self._message is None:
+                msg_type, nf, length = unpack_header(self._header_buffer)
+                if length > len(self._payload_buffer):
+                    self._payload_buffer = bytearray(length)
+                self._message = (msg_type, nf)
+                self._target = memoryview(self._payload_buffer)[:length]
+                self._received = 0
+                continue
+
+            msg_type, nf = self._message
+            payload = self._target
+
+            self._message = None
+            self._target = memoryview(self._header_buffer)
+            self._received = 0
+
+            return msg_type, nf, payload
+
+
+class MessageWriter:
+    # Outgoing queue for non-blocking sockets; buffers are referenced, not copied
+    def __init__(self):
+        self._views = collections.deque()
+
+    @property
+    def pending(self) -> bool:
+        return bool(self._views)
+
+    def append(self, msg_type: MessageType, nf: int = NO_FRAME, *payload):
+        length = sum(memoryview(part).nbytes for part in payload)
+        self._views.extend(_as_views([pack_header(msg_type, nf, length), *payload]))
+
+    def write_to(self, sock: socket.socket) -> bool:
+        # True once everything queued has been written
+        while self._views:
+            try:
+                sent = sock.sendmsg(list(itertools.islice(self._views, MAX_IOV)))
+            except (BlockingIOError, InterruptedError):
+                return False
+            _advance(self._views, sent)
+        return True
+
+
+def _as_views(buffers):
+    views = (memoryview(buffer).cast("B") for buffer in buffers)
+    return [view for view in views if view.nbytes]
+
+
+def _advance(views: collections.deque, sent: int):
+    while sent:
+        if sent >= views[0].nbytes:
+            sent -= views[0].nbytes
+            views.popleft()
+        else:
+            views[0] = views[0][sent:]
+            sent = 0
@@ -1,25 +1,66 @@
+import collections
+import functools
 import os
 import socket
 import threading
-from typing import Optional, List
+from concurrent import futures
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Dict
 
 import numpy as np
 
 from TrackerContest.core import Bus
+from TrackerContest.core.network.event_loop import TrackerEventLoop
+from TrackerContest.core.network.frame_packet import FramePacket
+from TrackerContest.core.network.frame_ring import FrameRing
+from TrackerContest.core.network.loop_tracker_client import LoopTrackerClient
+from TrackerContest.core.network.protocol import NO_FRAME
 from TrackerContest.core.network.tracker_client import TrackerClient
+from TrackerContest.core.results import ResultsStore
+from TrackerContest.core.video.frame_pool import FramePool
 
 
 class TrackerBroker:
     N_MAX_TRACKER = 10
+    # Frames a tracker may lag behind in non-waiting mode before dispatch blocks on it
+    MAX_IN_FLIGHT = 4
+    # Seconds flush waits for a real-time tracker to finish its last frame
+    IDLE_TIMEOUT = 10
+    # Seconds a connected tracker has to send its HELLO
+    HANDSHAKE_TIMEOUT = 10
 
-    def __init__(self, socket_path: str = "/tmp/server_socket"):
+    BACKEND_THREADS = "threads"
+    BACKEND_SELECTOR = "selector"
+
+    # Lockstep: every tracker gets every frame. Real-time: a busy tracker skips to the newest frame once free
+    MODE_LOCKSTEP = "lockstep"
+    MODE_REALTIME = "realtime"
+
+    def __init__(self, socket_path: str = "/tmp/server_socket", backend: str = BACKEND_THREADS,
+                 mode: str = MODE_LOCKSTEP, tcp_address: Optional[str] = None,
+                 frame_pool: Optional[FramePool] = None):
         self._socket_path = socket_path
+        # Optional "host:port" listener for trackers running on other machines
+        self._tcp_address = tcp_address
+        self._backend = backend
+        self._mode = mode
         self._clients: List[TrackerClient] = []
-        self._server_thread: threading.Thread = threading.Thread(target=self._start_server, daemon=True)
         self._server_socket: Optional[socket] = None
+        self._tcp_socket: Optional[socket] = None
+        self._event_loop: Optional[TrackerEventLoop] = None
+        # Non-waiting mode jobs per client; the decode thread adds to it while flush swaps it out
+        self._in_flight: Dict[TrackerClient, collections.deque] = {}
+        self._in_flight_lock = threading.Lock()
+        self._frame_ring = FrameRing()
+        # Pooled frames stay retained until every tracker job reading them is done
+        self._frame_pool = frame_pool
+        self._results = ResultsStore(n_trackers=TrackerBroker.N_MAX_TRACKER)
+        # cv2.imencode releases the GIL, compressed variants are encoded in parallel
+        self._encode_pool = ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix="FrameEncoder")
+        self._closed = False
 
         Bus.subscribe("changed-draw-mode", self._change_client_draw_mode)
-        Bus.subscribe("stop-tracking", self._stop_tracking)
+        Bus.subscribe("stop-tracking", self.stop_tracking)
 
     @property
     def server_address(self):
@@ -29,6 +70,18 @@ class TrackerBroker:
     def server_address(self, new_address: str):
         self._socket_path = new_address
 
+    @property
+    def mode(self) -> str:
+        return self._mode
+
+    @property
+    def results(self) -> ResultsStore:
+        return self._results
+
+    @property
+    def clients(self) -> List[TrackerClient]:
+        return list(self._clients)
+
     @property
     def num_clients(self):
         return len(self._clients)
@@ -41,58 +94,211 @@ class TrackerBroker:
         self._server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
         self._server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self._server_socket.bind(self._socket_path)
-        self._server_thread.start()
+        server_sockets = [self._server_socket]
 
-    def send_frame_all_clients(self, frame: np.ndarray, nf: int):
-        for client in self._clients:
-            client.start_track(frame, nf)
+        if self._tcp_address:
+            host, port = TrackerBroker.parse_address(self._tcp_address)
+            self._tcp_socket = socket.create_server((host, port),
+                                                    family=socket.AF_INET6 if ":" in host else socket.AF_INET)
+            server_sockets.append(self._tcp_socket)
 
-        self._join()
+        if self._backend == TrackerBroker.BACKEND_SELECTOR:
+            for server_socket in server_sockets:
+                server_socket.listen(socket.SOMAXCONN)
+            self._event_loop = TrackerEventLoop(server_sockets, self._accept_loop_client)
+            self._event_loop.start()
+            print(f"[INFO] Server listening on {self._listen_addresses()} (selector backend)")
+        else:
+            for server_socket in server_sockets:
+                threading.Thread(target=self._start_server, args=(server_socket,), daemon=True).start()
 
-    def init_all_tracker(self, frame: np.ndarray, gt_bbox: tuple):
-        for client in self._clients:
-            client.start_init(frame, gt_bbox)
+    def send_frame_all_clients(self, frame: np.ndarray, nf: int, wait: bool = True):
+        # A looping video writes over its earlier pass frame by frame, the rest of that pass can still be viewed
+        self._results.clear_frame(nf)
+        clients = list(self._clients)
+        n_shm_clients = sum(client.transport == TrackerClient.TRANSPORT_SHM for client in clients)
+        slot = self._frame_ring.write(frame, n_shm_clients) if n_shm_clients else None
+        # Encoded once per encoding and shared by all clients
+        packet = FramePacket(frame, nf, slot, self._frame_ring,
+                             self._frame_pool.release if self._frame_pool is not None else None)
+        # Real-time mode skips most frames of a slow tracker, they are encoded when dispatched instead
+        encode_ahead = [client for client in clients
+                        if client.encodes_ahead and self._mode != TrackerBroker.MODE_REALTIME]
+        n_jobs = len(clients) + len(encode_ahead)
+        if self._frame_pool is not None and n_jobs:
+            self._frame_pool.retain(frame)
+        packet.hold(n_jobs)
+        for client in encode_ahead:
+            self._encode_pool.submit(client.prepare_frame, packet) \
+                .add_done_callback(functools.partial(self._on_prepared, client, packet))
+
+        if self._mode == TrackerBroker.MODE_REALTIME:
+            for client in clients:
+                client.track_latest(packet)
+            return
+
+        if wait:
+            self._wait([client.track(packet) for client in clients])
+            return
 
-        self._join()
+        for client in clients:
+            with self._in_flight_lock:
+                in_flight = self._in_flight.setdefault(client, collections.deque())
+                while in_flight and in_flight[0].done():
+                    in_flight.popleft()
+                oldest = in_flight.popleft() if len(in_flight) >= TrackerBroker.MAX_IN_FLIGHT else None
+            if oldest is not None:
+                self._wait([oldest])
+            future = client.track(packet)
+            with self._in_flight_lock:
+                self._in_flight.setdefault(client, collections.deque()).append(future)
 
-    def get_all_bbox(self, nf: int = -1) -> list:
+    def flush(self):
+        with self._in_flight_lock:
+            in_flight, self._in_flight = self._in_flight, {}
+        self._wait([future for client_in_flight in in_flight.values() for future in client_in_flight])
+        for client in list(self._clients):
+            if not client.wait_idle(TrackerBroker.IDLE_TIMEOUT):
+                print(f"[Error] {client.name} did not finish its frames in {TrackerBroker.IDLE_TIMEOUT}s")
+
+    def init_all_tracker(self, frame: np.ndarray, gt_bbox: tuple, nf: int = NO_FRAME):
+        # A new session: bboxes of an earlier one must not show up as the latest ones
+        self._results.clear()
+        self._wait([client.start_init(frame, gt_bbox, nf) for client in list(self._clients)])
+
+    def get_all_bbox(self, nf: int = -1, latest: bool = False) -> list:
+        if latest:
+            return [(client.get_latest_bbox(nf), client.color) for client in self._clients if client.draw]
         return [(client.get_bbox(nf), client.color) for client in self._clients if client.draw]
 
+    def get_all_labeled_bbox(self, nf: int = -1, latest: bool = False) -> list:
+        # (bbox, color, name) of the drawn trackers, for the display overlay
+        clients = [client for client in list(self._clients) if client.draw]
+        if latest:
+            return [(client.get_latest_bbox(nf), client.color, client.name) for client in clients]
+        # Read every tracker at once, viewing asks for it each UI frame
+        bboxes, valid = self._results.get_range(max(0, nf), max(0, nf + 1), [client.results_row for client in clients])
+        return [(bboxes[i, 0] if valid[i, :1].any() else None, client.color, client.name)
+                for i, client in enumerate(clients)]
+
+    def reserve_frames(self, n_frames: int):
+        # A new video: results of the previous one go
+        self._results.clear()
+        self._results.set_period(0)
+        self._results.reserve(n_frames)
+
+    def set_loop_length(self, frame_count: int):
+        # Results of later loops of the video take the cells of the first loop instead of growing the store
+        self._results.set_period(frame_count)
+
+    def _on_prepared(self, client: TrackerClient, packet: FramePacket, future: futures.Future):
+        if future.cancelled():
+            # Never ran, the hold it was given is still taken
+            packet.release()
+            return
+        if future.exception() is not None:
+            print(f"[Error] Failed to encode frame {packet.nf} for {client.name}: {future.exception()}")
+            Bus.publish("error-tracking", client.name)
+
     def remove_tracker(self, name: str):
         for i in range(len(self._clients)):
             if self._clients[i].name == name:
-                self._clients.pop(i)
+                client = self._clients.pop(i)
+                client.close()
+                with self._in_flight_lock:
+                    self._in_flight.pop(client, None)
                 Bus.publish("remove-tracker", name)
+                break
 
     def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        Bus.unsubscribe("changed-draw-mode", self._change_client_draw_mode)
+        Bus.unsubscribe("stop-tracking", self.stop_tracking)
         for client in self._clients:
             client.close()
-        self._server_socket.close()
+        if self._event_loop is not None:
+            self._event_loop.stop()
+        self._encode_pool.shutdown(wait=False, cancel_futures=True)
+        for server_socket in (self._server_socket, self._tcp_socket):
+            if server_socket is None:
+                continue
+            # Wakes up an accept thread blocked on it, so the port is released right away
+            try:
+                server_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            server_socket.close()
+        self._frame_ring.close()
         try:
             os.remove(self._socket_path)
         except OSError:
             pass
 
-    def _start_server(self):
-        self._server_socket.listen(TrackerBroker.N_MAX_TRACKER)
+    def _start_server(self, server_socket: socket.socket):
+        server_socket.listen(TrackerBroker.N_MAX_TRACKER)
 
-        print(f"[INFO] Server listening on {self._socket_path}")
+        print(f"[INFO] Server listening on {self._format_address(server_socket.getsockname())}")
 
-        while True:
+        while server_socket.fileno() != -1:
             try:
-                client_socket, address = self._server_socket.accept()
-                tracker_client = TrackerClient(client_socket)
-                tracker_client.first_meeting()
-                tracker_client.address = "".join(map(str, address))
-                self._clients.append(tracker_client)
-                Bus.publish("connected-new-tracker", tracker_client.name, tracker_client.color, tracker_client.address)
-                print(f"[INFO] Connection established with {tracker_client.name}")
+                client_socket, address = server_socket.accept()
+                threading.Thread(target=self._meet_client, args=(client_socket, address), daemon=True).start()
             except Exception as e:
+                # Shut down by close(), accept fails until the socket is closed too
+                if self._closed or server_socket.fileno() == -1:
+                    break
                 print("[ERROR] Server error: ", e)
 
-    def _join(self):
-        for client in self._clients:
-            client.client_thread.join()
+    def _meet_client(self, client_socket: socket.socket, address):
+        # Off the accept loop and with a deadline: a peer that connects and stays silent holds up no other tracker
+        tracker_client = TrackerClient(client_socket, self._frame_ring, self._results)
+        tracker_client.address = self._format_address(address)
+        try:
+            client_socket.settimeout(TrackerBroker.HANDSHAKE_TIMEOUT)
+            tracker_client.first_meeting()
+            client_socket.settimeout(None)
+        except Exception as e:
+            print(f"[Error] Handshake with {tracker_client.address or 'a local tracker'} failed: {e}")
+            tracker_client.close()
+            return
+        self._register_client(tracker_client)
+
+    def _accept_loop_client(self, client_socket: socket.socket, address):
+        tracker_client = LoopTrackerClient(client_socket, self._event_loop, self._register_client, self._frame_ring,
+                                           self._results)
+        tracker_client.address = self._format_address(address)
+        tracker_client.first_meeting()
+
+    def _listen_addresses(self) -> str:
+        addresses = [self._socket_path]
+        if self._tcp_socket is not None:
+            addresses.append(self._format_address(self._tcp_socket.getsockname()))
+        return ", ".join(addresses)
+
+    @staticmethod
+    def parse_address(address: str) -> tuple:
+        # "host:port" or "[v6 host]:port"; without a host only local trackers can connect, listening on every
+        # interface takes an explicit 0.0.0.0 or [::]
+        host, _, port = address.rpartition(":")
+        host = host.strip("[]")
+        return host or "127.0.0.1", int(port)
+
+    @staticmethod
+    def _format_address(address) -> str:
+        if isinstance(address, tuple):
+            return f"{address[0]}:{address[1]}"
+        return "".join(map(str, address))
+
+    def _register_client(self, tracker_client: TrackerClient):
+        self._clients.append(tracker_client)
+        Bus.publish("connected-new-tracker", tracker_client.name, tracker_client.color, tracker_client.address)
+        print(f"[INFO] Connection established with {tracker_client.name}")
+
+    @staticmethod
+    def _wait(client_futures: List[futures.Future]):
+        futures.wait(client_futures)
 
     def _change_client_draw_mode(self, name: str, draw: bool):
         for client in self._clients:
@@ -100,6 +306,6 @@ class TrackerBroker:
                 client.draw = draw
                 break
 
-    def _stop_tracking(self):
-        for client in self._clients:
-            client.stop_tracking()
+    def stop_tracking(self):
+        self.flush()
+        self._wait([client.stop_tracking() for client in list(self._clients)])
@@ -1,30 +1,61 @@
-import pickle
+import queue
 import socket
 import threading
 import time
-from typing import Optional, Dict
+from concurrent.futures import Future
+from typing import Optional, Callable
 
-import msgpack_numpy as mp
 import numpy as np
 
 from TrackerContest.core import Bus
+from TrackerContest.core.network.frame_packet import FramePacket
+from TrackerContest.core.network.frame_ring import FrameRing
+from TrackerContest.core.network.frame_spec import FrameSpec, FrameTransform
+from TrackerContest.core.network.protocol import MessageSocket, MessageType, pack_init, unpack_object, NO_FRAME
+from TrackerContest.core.results import ResultsStore
 
 
 class TrackerClient:
+    TRANSPORT_SOCKET = "socket"
+    TRANSPORT_SHM = "shm"
 
-    def __init__(self, client_socket: socket.socket):
+    JOB_QUEUE_SIZE = 4
+    MAX_SEND_BUFFER = 64 << 20
+
+    def __init__(self, client_socket: socket.socket, frame_ring: Optional[FrameRing] = None,
+                 results_store: Optional[ResultsStore] = None):
         self._name: str = ""
         self._color: tuple = ()
+        self._transport = TrackerClient.TRANSPORT_SOCKET
+        self._encoding = FramePacket.ENCODING_MSGPACK
+        self._spec = FrameSpec()
         self._address: str = ""
         self._draw = True
         self._current_fps = 0
 
-        self._bboxes: Dict = {}
+        self._results = results_store if results_store is not None else ResultsStore(n_trackers=1)
+        self._row = -1
+
+        # Real-time mode state: the newest frame waiting for the tracker to become free
+        self._latest: Optional[tuple] = None
+        self._busy = False
+        # Frames skipped while a reply is in flight, they get that reply once it arrives
+        self._skipped: list = []
+        self._idle = threading.Condition()
 
-        self._client_thread: Optional[threading.Thread] = None
-        self._client_socket: socket.socket = client_socket
+        self._jobs: queue.Queue = queue.Queue(maxsize=TrackerClient.JOB_QUEUE_SIZE)
+        self._worker: Optional[threading.Thread] = None
+        # Guards _closed against _submit and signals free queue space, so no job is queued once closed
+        self._submit_cond = threading.Condition()
+        self._closed = False
+        self._connection = MessageSocket(client_socket)
+        self._frame_ring = frame_ring
 
-        self._receive_buffer = 1024
+        # Remote trackers connect over TCP: no shared memory, no Nagle delay, send buffer sized to the frame
+        self._remote = client_socket.family in (socket.AF_INET, socket.AF_INET6)
+        self._send_buffer_size = 0
+        if self._remote:
+            client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
 
     @property
     def name(self):
@@ -35,8 +66,30 @@ class TrackerClient:
         return self._color
 
     @property
-    def client_thread(self) -> threading.Thread:
-        return self._client_thread
+    def results_row(self) -> int:
+        return self._row
+
+    @property
+    def transport(self) -> str:
+        return self._transport
+
+    @property
+    def remote(self) -> bool:
+        return self._remote
+
+    @property
+    def compressed(self) -> bool:
+        return self._encoding == FramePacket.ENCODING_PNG or self._encoding.startswith(FramePacket.ENCODING_JPEG)
+
+    @property
+    def encodes_ahead(self) -> bool:
+        # Worth encoding on the broker's pool before the job runs; a search window depends on the reply to the
+        # previous frame, so it is only known once the frame is sent
+        return self.compressed and not self._spec.crops
+
+    @property
+    def pending_jobs(self) -> int:
+        return self._jobs.qsize()
 
     @property
     def draw(self) -> bool:
@@ -55,54 +108,250 @@ class TrackerClient:
         self._address = address
 
     def first_meeting(self):
-        data = self._client_socket.recv(1024)
-        info = pickle.loads(data)
-        self._name = info.get("name")
-        self._color = info.get("color")
+        _, payload = self._connection.expect(MessageType.HELLO)
+        self._on_hello(unpack_object(payload))
+        self._connection.send(MessageType.ACK)
+
+        self._worker = threading.Thread(target=self._work, daemon=True, name=f"TrackerClient-{self._name}")
+        self._worker.start()
+
+    def start_track(self, packet: FramePacket) -> Future:
+        return self._hold_slot(packet, self._submit(self._track, packet))
+
+    def start_init(self, frame: np.ndarray, gt_bbox: tuple, nf: int = NO_FRAME) -> Future:
+        self._on_init(gt_bbox, nf)
+        return self._submit(self._init, frame, gt_bbox, nf)
+
+    def track(self, packet: FramePacket, arrival: Optional[float] = None) -> Future:
+        arrival = time.perf_counter() if arrival is None else arrival
+        future = self.start_track(packet)
+        future.add_done_callback(lambda f: self._record_latency(f, packet.nf, arrival))
+        future.add_done_callback(lambda _: packet.release())
+        return future
 
-    def start_track(self, frame: np.ndarray, nf: int):
-        self._client_thread = threading.Thread(target=self._track, daemon=True, args=(frame, nf))
-        self._client_thread.start()
+    def track_latest(self, packet: FramePacket):
+        # Real-time mode: a busy tracker keeps only the newest frame, the one it replaces is skipped
+        arrival = time.perf_counter()
+        with self._idle:
+            if self._busy:
+                if self._latest is not None:
+                    self._skip(*self._latest)
+                self._latest = (packet, arrival)
+                return
+            self._busy = True
 
-    def start_init(self, frame: np.ndarray, gt_bbox: tuple):
-        self._client_thread = threading.Thread(target=self._init, daemon=True, args=(frame, gt_bbox,))
-        self._client_thread.start()
+        self._dispatch_latest(packet, arrival)
 
-    def stop_tracking(self):
-        self._client_thread.join()
-        self._send_data("stop")
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._busy, timeout)
+
+    def stop_tracking(self) -> Future:
+        return self._submit(self._stop)
+
+    def prepare_frame(self, packet: FramePacket):
+        # Builds this tracker's message for the packet ahead of time, e.g. on an encoder pool
+        try:
+            self._frame_message(packet)
+        finally:
+            packet.release()
 
     def get_bbox(self, nf):
-        return self._bboxes.get(nf)
+        return self._results.get(self._row, nf)
+
+    def get_latency(self, nf) -> Optional[float]:
+        return self._results.get_latency(self._row, nf)
+
+    def is_skipped(self, nf) -> bool:
+        return self._results.is_skipped(self._row, nf)
+
+    def get_latest_bbox(self, nf):
+        return self._results.get_latest(self._row, nf)
 
     def close(self):
-        self._client_socket.close()
+        self._connection.close()
+        with self._submit_cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._submit_cond.notify_all()
+            # Wakes a worker waiting for jobs; with a full queue it is busy and sees _closed after the job
+            try:
+                self._jobs.put_nowait(None)
+            except queue.Full:
+                pass
 
-    def _track(self, frame: np.ndarray, nf: int):
+    def _dispatch_latest(self, packet: FramePacket, arrival: float):
+        self.track(packet, arrival).add_done_callback(self._latest_done)
+
+    def _latest_done(self, future: Future):
+        bbox = future.result() if not future.cancelled() and future.exception() is None else None
+        with self._idle:
+            skipped, self._skipped = self._skipped, []
+            for nf in skipped:
+                self._results.write(self._row, nf, bbox, skipped=True)
+            latest, self._latest = self._latest, None
+            if latest is None:
+                self._busy = False
+                self._idle.notify_all()
+                return
+
+        self._dispatch_latest(*latest)
+
+    def _record_latency(self, future: Future, nf: int, arrival: float):
+        # Cancelled and failed jobs have no reply to measure
+        if future.cancelled() or future.exception() is not None:
+            return
+        self._results.set_latency(self._row, nf, time.perf_counter() - arrival)
+
+    def _skip(self, packet: FramePacket, arrival: float):
+        # No result until the reply in flight arrives, the last one would be stale by then
+        self._results.write(self._row, packet.nf, None, skipped=True)
+        self._skipped.append(packet.nf)
+        if self._frame_encoding(packet) == FramePacket.ENCODING_SHM:
+            self._frame_ring.release(packet.slot)
+        packet.release()
+
+    def _hold_slot(self, packet: FramePacket, future: Future) -> Future:
+        # Every shm client holds the frame slot until its job is done
+        if self._frame_encoding(packet) == FramePacket.ENCODING_SHM:
+            future.add_done_callback(lambda _: self._frame_ring.release(packet.slot))
+        return future
+
+    def _submit(self, job: Callable, *args) -> Future:
+        # Blocks while the tracker is JOB_QUEUE_SIZE jobs behind
+        future = Future()
+        with self._submit_cond:
+            self._submit_cond.wait_for(lambda: self._closed or not self._jobs.full())
+            if self._closed:
+                TrackerClient._cancel(future)
+            else:
+                self._jobs.put_nowait((job, args, future))
+        return future
+
+    def _work(self):
+        while True:
+            item = self._jobs.get()
+            with self._submit_cond:
+                self._submit_cond.notify_all()
+            if item is None or self._closed:
+                if item is not None:
+                    TrackerClient._cancel(item[2])
+                break
+
+            job, args, future = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(job(*args))
+            except Exception as e:
+                future.set_exception(e)
+
+        # Jobs are only queued before _closed is set, none is left waiting on a future that never resolves
+        while True:
+            try:
+                item = self._jobs.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                TrackerClient._cancel(item[2])
+
+    @staticmethod
+    def _cancel(future: Future):
+        # Notified too, concurrent.futures.wait only counts cancelled futures as done once notified
+        if future.cancel():
+            future.set_running_or_notify_cancel()
+
+    def _stop(self):
+        try:
+            if self._send_data(MessageType.STOP):
+                self._connection.expect(MessageType.ACK)
+        except Exception as e:
+            print(f"[Error] Failed stop ({self.name}): {e}")
+
+    def _track(self, packet: FramePacket):
         try:
-            self._send_data(frame)
-            self._receive_data(nf)
+            message, transform = self._frame_message(packet)
+            if self._send_data(*message, nf=packet.nf):
+                return self._receive_data(packet.nf, transform)
         except Exception as e:
             print(f"[Error] Failed track ({self.name}): {e}")
 
-    def _init(self, frame: np.ndarray, gt_bbox: tuple):
+    def _init(self, frame: np.ndarray, gt_bbox: tuple, nf: int):
         try:
-            self._send_data(frame)
-            time.sleep(0.1)
-            self._send_data(gt_bbox)
-            time.sleep(0.1)
+            if self._send_data(MessageType.INIT, self._init_payload(frame, gt_bbox), nf=nf):
+                self._connection.expect(MessageType.ACK)
         except Exception as e:
             print(f"[Error] Failed init ({self.name}): {e}")
 
-    def _send_data(self, frame):
+    def _frame_message(self, packet: FramePacket) -> tuple:
+        # The tracker's variant of the frame, cropped around its last output when it asked for a search window.
+        # Called when the frame is sent, the previous reply is in by then
+        crop = self._spec.crop_region(self._results.get_latest(self._row, packet.nf), packet.frame.shape)
+        message, transform = packet.message(self._frame_encoding(packet), self._spec, crop)
+        self._fit_send_buffer(message)
+        return message, transform
+
+    def _fit_send_buffer(self, message: tuple):
+        if not self._remote:
+            return
+        nbytes = sum(memoryview(part).nbytes for part in message[1:])
+        if nbytes > self._send_buffer_size and self._send_buffer_size < TrackerClient.MAX_SEND_BUFFER:
+            self._send_buffer_size = min(nbytes, TrackerClient.MAX_SEND_BUFFER)
+            self._connection.socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self._send_buffer_size)
+
+    def _init_payload(self, frame: np.ndarray, gt_bbox: tuple) -> bytes:
+        frame, transform = self._spec.apply(frame, self._spec.crop_region(gt_bbox, frame.shape)) \
+            if not self._spec.is_identity else (frame, FrameTransform())
+        return pack_init(frame, transform.to_variant(gt_bbox))
+
+    def _frame_encoding(self, packet: FramePacket) -> str:
+        if self._transport == TrackerClient.TRANSPORT_SHM and packet.slot is not None:
+            return FramePacket.ENCODING_SHM
+        return self._encoding
+
+    def _on_init(self, gt_bbox: tuple, nf: int):
+        # The ground truth is the output carried forward until the first reply
+        if nf != NO_FRAME:
+            self._results.write(self._row, nf, gt_bbox)
+
+    def _on_hello(self, info: dict):
+        self._row = self._results.add_tracker()
+        self._name = info.get("name")
+        self._color = info.get("color")
+        transport = info.get("transport", TrackerClient.TRANSPORT_SOCKET)
+        self._spec = FrameSpec.from_info(info)
+        # Shared memory carries the full frame only, trackers asking for a variant get it over the socket
+        if transport == TrackerClient.TRANSPORT_SHM and self._frame_ring is not None and self._spec.is_identity \
+                and not self._remote:
+            self._transport = transport
+
+        compression = info.get("compression")
+        if compression == FramePacket.ENCODING_PNG:
+            self._encoding = FramePacket.ENCODING_PNG
+        elif compression == FramePacket.ENCODING_JPEG:
+            self._encoding = f"{FramePacket.ENCODING_JPEG}:{int(info.get('jpeg_quality', 90))}"
+        elif FramePacket.ENCODING_RAW in (compression, info.get("encoding")):
+            self._encoding = FramePacket.ENCODING_RAW
+
+    def _send_data(self, msg_type: MessageType, *payload, nf: int = NO_FRAME) -> bool:
         try:
-            serialized_array = mp.packb(frame, default=mp.encode)
-            self._client_socket.send(serialized_array)
-        except BrokenPipeError or ConnectionResetError:
+            self._connection.send(msg_type, nf, *payload)
+            return True
+        except (BrokenPipeError, ConnectionResetError):
             Bus.publish("error-tracking", self._name)
+            return False
+
+    def _receive_data(self, nf: int, transform: FrameTransform):
+        reply_nf, payload = self._connection.expect(MessageType.BBOX)
+        return self._on_bbox(nf, reply_nf, payload, transform)
 
-    def _receive_data(self, nf: int):
-        response_dict = pickle.loads(self._client_socket.recv(self._receive_buffer))
+    def _on_bbox(self, nf: int, reply_nf: int, payload, transform: FrameTransform):
+        if reply_nf != nf:
+            print(f"[Error] {self.name} answered frame {reply_nf} instead of {nf}")
+        response_dict = unpack_object(payload)
         self._current_fps = response_dict.get("fps")
-        self._bboxes[nf] = response_dict.get("bbox")
+        bbox = transform.to_frame(response_dict.get("bbox"))
+        self._results.write(self._row, nf, bbox, fps=self._current_fps if self._current_fps is not None else np.nan)
         Bus.publish("update-tracker-fps", self._name, self._current_fps)
+        return bbox
@@ -0,0 +1,185 @@
+import threading
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+class ResultsStore:
+    # bboxes: trackers x frames x 4 (x, y, w, h), plus per cell validity, skip flag, fps and latency
+    BYTES_PER_CELL = 4 * 4 + 1 + 1 + 4 + 4
+
+    def __init__(self, n_trackers: int = 10, n_frames: int = 1024):
+        self._lock = threading.Lock()
+        self._n_rows = 0
+
+        self._bboxes = np.zeros((n_trackers, n_frames, 4), dtype=np.float32)
+        self._valid = np.zeros((n_trackers, n_frames), dtype=bool)
+        self._skipped = np.zeros((n_trackers, n_frames), dtype=bool)
+        self._fps = np.full((n_trackers, n_frames), np.nan, dtype=np.float32)
+        self._latency = np.full((n_trackers, n_frames), np.nan, dtype=np.float32)
+        # Last frame each tracker produced itself (not carried forward)
+        self._last_nf = np.full(n_trackers, -1, dtype=np.int64)
+        # Frame numbers of a looping video keep counting: with a period, later loops write over the first one
+        self._period = 0
+
+    @staticmethod
+    def expected_nbytes(n_trackers: int, n_frames: int) -> int:
+        return n_trackers * n_frames * ResultsStore.BYTES_PER_CELL
+
+    @property
+    def n_trackers(self) -> int:
+        return self._n_rows
+
+    @property
+    def n_frames(self) -> int:
+        return self._bboxes.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in (self._bboxes, self._valid, self._skipped, self._fps, self._latency))
+
+    def add_tracker(self) -> int:
+        with self._lock:
+            if self._n_rows == self._bboxes.shape[0]:
+                self._resize(max(1, 2 * self._n_rows), self.n_frames)
+            row = self._n_rows
+            self._n_rows += 1
+            return row
+
+    def reserve(self, n_frames: int):
+        with self._lock:
+            if n_frames > self.n_frames:
+                self._resize(self._bboxes.shape[0], n_frames)
+
+    def set_period(self, n_frames: int):
+        with self._lock:
+            self._period = max(0, n_frames)
+
+    def clear(self):
+        # Forgets every result, e.g. when a new tracking session starts; trackers keep their rows
+        with self._lock:
+            self._valid[:] = False
+            self._skipped[:] = False
+            self._fps[:] = np.nan
+            self._latency[:] = np.nan
+            self._last_nf[:] = -1
+
+    def clear_frame(self, nf: int):
+        # Forgets the results of one frame, for every tracker
+        with self._lock:
+            index = self._index(nf)
+            if 0 <= index < self.n_frames:
+                self._valid[:, index] = False
+                self._skipped[:, index] = False
+                self._fps[:, index] = np.nan
+                self._latency[:, index] = np.nan
+
+    def write(self, row: int, nf: int, bbox, fps: float = np.nan, skipped: bool = False):
+        with self._lock:
+            index = self._index(nf)
+            self._ensure_frame(index)
+            if bbox is None:
+                self._valid[row, index] = False
+            else:
+                self._bboxes[row, index] = bbox
+                self._valid[row, index] = True
+            self._skipped[row, index] = skipped
+            self._fps[row, index] = fps
+            if not skipped and nf > self._last_nf[row]:
+                self._last_nf[row] = nf
+
+    def set_latency(self, row: int, nf: int, latency: float):
+        with self._lock:
+            index = self._index(nf)
+            self._ensure_frame(index)
+            self._latency[row, index] = latency
+
+    def get(self, row: int, nf: int) -> Optional[np.ndarray]:
+        with self._lock:
+            return self._get(row, nf)
+
+    def get_latest(self, row: int, nf: int) -> Optional[np.ndarray]:
+        with self._lock:
+            bbox = self._get(row, nf)
+            if bbox is not None:
+                return bbox
+            last_nf = self._last_nf[row]
+            if 0 <= last_nf <= nf:
+                return self._get(row, last_nf)
+            return None
+
+    def last_frame(self, row: int) -> int:
+        with self._lock:
+            return int(self._last_nf[row])
+
+    def is_skipped(self, row: int, nf: int) -> bool:
+        with self._lock:
+            index = self._index(nf)
+            return 0 <= index < self.n_frames and bool(self._skipped[row, index])
+
+    def get_latency(self, row: int, nf: int) -> Optional[float]:
+        with self._lock:
+            index = self._index(nf)
+            if not 0 <= index < self.n_frames or np.isnan(self._latency[row, index]):
+                return None
+            return float(self._latency[row, index])
+
+    def get_range(self, start: int, stop: int, rows=None) -> Tuple[np.ndarray, np.ndarray]:
+        # Vectorized read for viewing: (len(rows) x frames x 4 bboxes, len(rows) x frames validity)
+        rows = slice(0, self._n_rows) if rows is None else rows
+        with self._lock:
+            frames = self._frames(start, stop)
+            return self._bboxes[rows][:, frames].copy(), self._valid[rows][:, frames].copy()
+
+    def get_timings(self, start: int, stop: int, rows=None) -> Tuple[np.ndarray, np.ndarray]:
+        # (latency in seconds, tracker reported fps), NaN where unknown
+        rows = slice(0, self._n_rows) if rows is None else rows
+        with self._lock:
+            frames = self._frames(start, stop)
+            return self._latency[rows][:, frames].copy(), self._fps[rows][:, frames].copy()
+
+    def get_skipped(self, start: int, stop: int, rows=None) -> np.ndarray:
+        # Frames real-time mode skipped: the tracker never saw them
+        rows = slice(0, self._n_rows) if rows is None else rows
+        with self._lock:
+            return self._skipped[rows][:, self._frames(start, stop)].copy()
+
+    def _get(self, row: int, nf: int) -> Optional[np.ndarray]:
+        index = self._index(nf)
+        if not 0 <= index < self.n_frames or not self._valid[row, index]:
+            return None
+        return self._bboxes[row, index].copy()
+
+    def _index(self, nf: int) -> int:
+        # Frame numbers start at 1, frame period + 1 is frame 1 of the next loop
+        if self._period and nf > self._period:
+            return (nf - 1) % self._period + 1
+        return nf
+
+    def _frames(self, start: int, stop: int):
+        # Cells of frames start..stop-1: a slice, or one index per frame when the range runs into a later loop
+        first = self._index(start)
+        if not self._period or first + stop - start - 1 <= self._period:
+            return slice(first, min(first + stop - start, self.n_frames))
+        indices = np.array([self._index(nf) for nf in range(start, stop)], dtype=np.int64)
+        return indices[indices < self.n_frames]
+
+    def _ensure_frame(self, nf: int):
+        if nf >= self.n_frames:
+            self._resize(self._bboxes.shape[0], max(nf + 1, 2 * self.n_frames))
+
+    def _resize(self, n_trackers: int, n_frames: int):
+        def grow(array: np.ndarray, fill) -> np.ndarray:
+            new_array = np.full((n_trackers, n_frames) + array.shape[2:], fill, dtype=array.dtype)
+            new_array[:array.shape[0], :array.shape[1]] = array
+            return new_array
+
+        self._bboxes = grow(self._bboxes, 0)
+        self._valid = grow(self._valid, False)
+        self._skipped = grow(self._skipped, False)
+        self._fps = grow(self._fps, np.nan)
+        self._latency = grow(self._latency, np.nan)
+
+        last_nf = np.full(n_trackers, -1, dtype=np.int64)
+        last_nf[:self._last_nf.shape[0]] = self._last_nf
+        self._last_nf = last_nf
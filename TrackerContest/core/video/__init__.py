@@ -1 +1,8 @@
+from .decoded_cache import DecodedCache, DecodedVideo
+from .frame_cache import FrameCache
+from .frame_index import FrameIndex
+from .frame_pool import FramePool
+from .frame_slot import FrameSlot
+from .frame_source import FrameSource, VideoFileSource, ImageSequenceSource
+from .segmented_reader import SegmentedReader
 from .video_player import VideoPlayer
@@ -0,0 +1,183 @@
+import hashlib
+import os
+import struct
+import threading
+from typing import Optional
+
+import cv2
+import numpy as np
+
+
+class DecodedVideo:
+    # A cached video: fixed header, RGB frames laid out contiguously, then the frame offset index
+    MAGIC = b"TCFRAMES"
+    VERSION = 1
+    HEADER = struct.Struct("!8sIIIIdQQ")
+    HEADER_SIZE = 4096
+
+    def __init__(self, path: str):
+        self._path = path
+        self._data = np.memmap(path, dtype=np.uint8, mode="r")
+
+        magic, version, height, width, channels, fps, n_frames, index_offset = \
+            DecodedVideo.HEADER.unpack_from(self._data, 0)
+        if magic != DecodedVideo.MAGIC or version != DecodedVideo.VERSION:
+            raise ValueError(f"Not a decoded video cache file: {path}")
+        self._shape = (height, width, channels)
+        self._fps = fps
+        self._offsets = np.frombuffer(self._data, dtype=">u8", count=n_frames, offset=index_offset)
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def frame_count(self) -> int:
+        return len(self._offsets)
+
+    @property
+    def frame_shape(self) -> tuple:
+        return self._shape
+
+    @property
+    def fps(self) -> float:
+        return self._fps
+
+    def frame(self, index: int) -> Optional[np.ndarray]:
+        # Read-only view of the mapped file
+        if not 0 <= index < len(self._offsets):
+            return None
+        offset = int(self._offsets[index])
+        return self._data[offset:offset + int(np.prod(self._shape))].reshape(self._shape)
+
+
+class DecodedCache:
+    # Directory of decoded videos, keyed by path, size and mtime; least recently used ones evicted past max_bytes
+    SUFFIX = ".frames"
+
+    def __init__(self, cache_dir: str, max_bytes: int = 64 << 30):
+        self._cache_dir = cache_dir
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @property
+    def cache_dir(self) -> str:
+        return self._cache_dir
+
+    @property
+    def max_bytes(self) -> int:
+        return self._max_bytes
+
+    @property
+    def nbytes(self) -> int:
+        return sum(size for _, size, _ in self._file_stats())
+
+    def open(self, file_path: str) -> Optional[DecodedVideo]:
+        path = self._cache_path(file_path)
+        try:
+            video = DecodedVideo(path)
+            # The mtime of a cache file is its last use
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return video
+
+    def get(self, file_path: str) -> Optional[DecodedVideo]:
+        # Decodes the video into the cache first if needed; None if it does not fit
+        video = self.open(file_path)
+        if video is None and self.build(file_path):
+            video = self.open(file_path)
+        return video
+
+    def build(self, file_path: str) -> bool:
+        cap = cv2.VideoCapture(file_path)
+        if not cap.isOpened():
+            return False
+        shape = (int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), 3)
+        frame_nbytes = int(np.prod(shape))
+        expected_nbytes = DecodedVideo.HEADER_SIZE + int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) * (frame_nbytes + 8)
+        if expected_nbytes > self._max_bytes:
+            cap.release()
+            print(f"[INFO] {file_path} is too large for the frame cache")
+            return False
+        self._evict(expected_nbytes)
+
+        path = self._cache_path(file_path)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        offsets = []
+        too_large = False
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(bytes(DecodedVideo.HEADER_SIZE))
+                bgr, frame = None, np.empty(shape, dtype=np.uint8)
+                while True:
+                    ret, bgr = cap.read(bgr)
+                    if not ret or bgr.shape != shape:
+                        break
+                    # The frame count the estimate came from may be wrong or unknown, the size limit holds anyway
+                    if f.tell() + frame_nbytes + (len(offsets) + 1) * 8 > self._max_bytes:
+                        too_large = True
+                        break
+                    cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB, dst=frame)
+                    offsets.append(f.tell())
+                    f.write(frame.data)
+
+                index_offset = f.tell()
+                f.write(np.array(offsets, dtype=">u8").tobytes())
+                f.seek(0)
+                f.write(DecodedVideo.HEADER.pack(DecodedVideo.MAGIC, DecodedVideo.VERSION, *shape,
+                                                 cap.get(cv2.CAP_PROP_FPS), len(offsets), index_offset))
+            if too_large:
+                os.remove(tmp_path)
+                print(f"[INFO] {file_path} is too large for the frame cache")
+                return False
+            # Room for what was written, the estimate evicted for may have been short
+            self._evict(os.path.getsize(tmp_path))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"[Error] Failed to cache {file_path}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return False
+        finally:
+            cap.release()
+        return True
+
+    def _cache_path(self, file_path: str) -> str:
+        stat = os.stat(file_path)
+        key = f"{os.path.abspath(file_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+        return os.path.join(self._cache_dir, hashlib.sha1(key.encode()).hexdigest() + DecodedCache.SUFFIX)
+
+    def _cached_files(self) -> list:
+        return [os.path.join(self._cache_dir, name) for name in os.listdir(self._cache_dir)
+                if name.endswith(DecodedCache.SUFFIX)]
+
+    def _file_stats(self) -> list:
+        # (mtime, size, path) of the cached files; other processes sharing the directory may evict any of them
+        # meanwhile, those are left out
+        stats = []
+        for path in self._cached_files():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            stats.append((stat.st_mtime, stat.st_size, path))
+        return stats
+
+    def _evict(self, needed_bytes: int):
+        # The lock is per process only, files are removed with other processes possibly doing the same
+        with self._lock:
+            files = sorted(self._file_stats())
+            total = sum(size for _, size, _ in files)
+            while files and total + needed_bytes > self._max_bytes:
+                _, size, path = files.pop(0)
+                total -= size
+                # Mapped elsewhere the data stays readable until unmapped
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                print(f"[INFO] Evicted {path} from the frame cache")
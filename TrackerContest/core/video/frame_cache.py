@@ -0,0 +1,63 @@
+import collections
+import threading
+from typing import Optional
+
+import numpy as np
+
+
+class FrameCache:
+    # Recently decoded frames by frame index, least recently used ones evicted past max_bytes
+    def __init__(self, max_bytes: int = 256 << 20):
+        self._max_bytes = max_bytes
+        self._frames = collections.OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def nbytes(self) -> int:
+        return self._nbytes
+
+    @property
+    def hits(self) -> int:
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        return self._misses
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __contains__(self, index: int) -> bool:
+        return index in self._frames
+
+    def get(self, index: int) -> Optional[np.ndarray]:
+        with self._lock:
+            frame = self._frames.get(index)
+            if frame is None:
+                self._misses += 1
+                return None
+            self._frames.move_to_end(index)
+            self._hits += 1
+            return frame
+
+    def put(self, index: int, frame: np.ndarray):
+        if frame.nbytes > self._max_bytes:
+            return
+        with self._lock:
+            previous = self._frames.pop(index, None)
+            if previous is not None:
+                self._nbytes -= previous.nbytes
+            self._frames[index] = frame
+            self._nbytes += frame.nbytes
+            while self._nbytes > self._max_bytes:
+                _, evicted = self._frames.popitem(last=False)
+                self._nbytes -= evicted.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self._nbytes = 0
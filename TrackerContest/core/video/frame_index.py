@@ -0,0 +1,81 @@
+import bisect
+import json
+import os
+from typing import List, Optional
+
+import cv2
+
+
+class FrameIndex:
+    # Keyframe positions and timestamps (ms) of every frame, cached next to the video
+    VERSION = 1
+    SUFFIX = ".tcindex"
+
+    def __init__(self, keyframes: List[int], timestamps: List[float]):
+        self._keyframes = keyframes
+        self._timestamps = timestamps
+
+    @staticmethod
+    def load_or_build(file_path: str):
+        stat = os.stat(file_path)
+        key = {"version": FrameIndex.VERSION, "size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+        index = FrameIndex.load(file_path, key)
+        if index is None:
+            index = FrameIndex.build(file_path)
+            if index is not None:
+                index.save(file_path, key)
+        return index
+
+    @staticmethod
+    def load(file_path: str, key: dict):
+        try:
+            with open(file_path + FrameIndex.SUFFIX, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if any(data.get(name) != value for name, value in key.items()):
+            return None
+        return FrameIndex(data["keyframes"], data["timestamps"])
+
+    @staticmethod
+    def build(file_path: str):
+        # Demuxes packets without decoding them
+        cap = cv2.VideoCapture(file_path, cv2.CAP_FFMPEG)
+        if not cap.isOpened() or not cap.set(cv2.CAP_PROP_FORMAT, -1):
+            cap.release()
+            return None
+
+        keyframes, timestamps = [], []
+        while cap.grab():
+            if cap.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME):
+                keyframes.append(len(timestamps))
+            timestamps.append(cap.get(cv2.CAP_PROP_POS_MSEC))
+        cap.release()
+
+        if not keyframes or keyframes[0] != 0:
+            return None
+        return FrameIndex(keyframes, timestamps)
+
+    def save(self, file_path: str, key: dict):
+        index_path = file_path + FrameIndex.SUFFIX
+        try:
+            with open(index_path + ".tmp", "w") as f:
+                json.dump({**key, "keyframes": self._keyframes, "timestamps": self._timestamps}, f)
+            os.replace(index_path + ".tmp", index_path)
+        except OSError as e:
+            print(f"[INFO] Frame index not cached ({index_path}): {e}")
+
+    @property
+    def frame_count(self) -> int:
+        return len(self._timestamps)
+
+    @property
+    def keyframes(self) -> List[int]:
+        return self._keyframes
+
+    def keyframe_before(self, index: int) -> int:
+        return self._keyframes[bisect.bisect_right(self._keyframes, index) - 1]
+
+    def timestamp(self, index: int) -> Optional[float]:
+        return self._timestamps[index] if 0 <= index < len(self._timestamps) else None
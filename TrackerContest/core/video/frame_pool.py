@@ -0,0 +1,105 @@
+import collections
+import threading
+from typing import Optional
+
+import numpy as np
+
+
+class FramePool:
+    # Preallocated frame buffers, reference counted: a buffer is reused once every holder released it
+    def __init__(self, max_bytes: int = 768 << 20):
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        self._buffers = {}  # buffer address -> [buffer, refcount]
+        self._free = collections.deque()  # released longest ago first
+        self._nbytes = 0
+
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def n_buffers(self) -> int:
+        return len(self._buffers)
+
+    @property
+    def n_free(self) -> int:
+        return len(self._free)
+
+    @property
+    def nbytes(self) -> int:
+        return self._nbytes
+
+    @property
+    def hits(self) -> int:
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        return self._misses
+
+    @property
+    def hit_rate(self) -> float:
+        requests = self._hits + self._misses
+        return self._hits / requests if requests else 0.0
+
+    def acquire(self, shape: tuple, dtype=np.uint8) -> np.ndarray:
+        # Holds one reference for the caller; past max_bytes the frame is a plain, unpooled array
+        with self._lock:
+            while self._free:
+                address = self._free.popleft()
+                buffer = self._buffers[address][0]
+                if buffer.shape == shape and buffer.dtype == dtype:
+                    self._buffers[address][1] = 1
+                    self._hits += 1
+                    return buffer
+                # Frame size changed, drop the old buffer
+                del self._buffers[address]
+                self._nbytes -= buffer.nbytes
+
+            self._misses += 1
+            buffer = np.empty(shape, dtype=dtype)
+            if self._nbytes + buffer.nbytes <= self._max_bytes:
+                self._buffers[FramePool._address(buffer)] = [buffer, 1]
+                self._nbytes += buffer.nbytes
+            return buffer
+
+    def copy(self, frame: np.ndarray) -> np.ndarray:
+        buffer = self.acquire(frame.shape, frame.dtype)
+        np.copyto(buffer, frame)
+        return buffer
+
+    def retain(self, frame: Optional[np.ndarray]):
+        # No-op for frames that are not pool buffers
+        with self._lock:
+            entry = self._entry(frame)
+            if entry is not None:
+                entry[1] += 1
+
+    def release(self, frame: Optional[np.ndarray]):
+        with self._lock:
+            entry = self._entry(frame)
+            if entry is None or entry[1] <= 0:
+                return
+            entry[1] -= 1
+            if entry[1] == 0:
+                self._free.append(FramePool._address(entry[0]))
+
+    def clear(self):
+        # Buffers still held are forgotten, their holders keep them alive
+        with self._lock:
+            self._buffers.clear()
+            self._free.clear()
+            self._nbytes = 0
+
+    def _entry(self, frame: Optional[np.ndarray]) -> Optional[list]:
+        if frame is None:
+            return None
+        entry = self._buffers.get(FramePool._address(frame))
+        if entry is None or entry[0].shape != frame.shape:
+            return None
+        return entry
+
+    @staticmethod
+    def _address(frame: np.ndarray) -> int:
+        return frame.__array_interface__["data"][0]
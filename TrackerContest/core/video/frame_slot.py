@@ -0,0 +1,53 @@
+import threading
+from typing import Optional, Any
+
+import numpy as np
+
+from TrackerContest.core.video.frame_pool import FramePool
+
+
+class FrameSlot:
+    # Latest value mailbox between the thread publishing frames and the render loop: a put replaces the
+    # frame held and bumps the generation, readers only get a frame newer than the one they have
+    def __init__(self, frame_pool: Optional[FramePool] = None):
+        self._frame_pool = frame_pool
+        self._lock = threading.Lock()
+
+        self._frame: Optional[np.ndarray] = None
+        self._info: Any = None
+        self._generation = 0
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def put(self, frame: np.ndarray, info: Any = None):
+        # The slot holds the frame retained in the pool until the next put replaces it
+        if self._frame_pool is not None:
+            self._frame_pool.retain(frame)
+        with self._lock:
+            previous, self._frame, self._info = self._frame, frame, info
+            self._generation += 1
+        if self._frame_pool is not None:
+            self._frame_pool.release(previous)
+
+    def get(self, generation: int = -1) -> tuple:
+        # (frame, info, generation); frame is None when the slot holds nothing newer than generation.
+        # A returned frame stays retained until given back with release()
+        with self._lock:
+            if self._frame is None or self._generation == generation:
+                return None, None, self._generation
+            if self._frame_pool is not None:
+                self._frame_pool.retain(self._frame)
+            return self._frame, self._info, self._generation
+
+    def release(self, frame: Optional[np.ndarray]):
+        if self._frame_pool is not None:
+            self._frame_pool.release(frame)
+
+    def clear(self):
+        with self._lock:
+            previous, self._frame, self._info = self._frame, None, None
+            self._generation += 1
+        if self._frame_pool is not None:
+            self._frame_pool.release(previous)
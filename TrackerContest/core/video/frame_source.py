@@ -0,0 +1,220 @@
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Optional, Tuple, Dict, List
+
+import cv2
+import numpy as np
+
+from TrackerContest.core.video.frame_index import FrameIndex
+
+
+class FrameSource:
+    # Frames of one input by index, BGR as decoded. Not thread-safe, the player serializes the calls
+    VIDEO_EXTENSIONS = (".mp4", ".avi", ".mkv", ".mov", ".webm")
+    IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+    @staticmethod
+    def open(path: str, seekable: bool = True):
+        # seekable=False for sequential reads: no keyframe index for video files
+        if os.path.isdir(path):
+            return ImageSequenceSource(path)
+        return VideoFileSource(path, seekable)
+
+    @staticmethod
+    def is_supported(path: str) -> bool:
+        if os.path.isdir(path):
+            return any(name.lower().endswith(FrameSource.IMAGE_EXTENSIONS) for name in os.listdir(path))
+        return os.path.isfile(path) and path.lower().endswith(FrameSource.VIDEO_EXTENSIONS)
+
+    @property
+    def path(self) -> str:
+        return ""
+
+    @property
+    def fps(self) -> float:
+        return 0.0
+
+    @property
+    def frame_count(self) -> int:
+        return 0
+
+    @property
+    def frame_size(self) -> Tuple[int, int]:
+        # (width, height)
+        return 0, 0
+
+    @property
+    def position(self) -> int:
+        # Index of the frame read() returns next
+        return 0
+
+    def keyframe_before(self, index: int) -> int:
+        # Closest index at or before index that can be read without decoding the frames before it
+        return index
+
+    def seek(self, index: int):
+        pass
+
+    def read(self, bgr: Optional[np.ndarray] = None) -> Tuple[bool, Optional[np.ndarray]]:
+        # Like cv2.VideoCapture.read, decodes into bgr when the source can
+        return False, None
+
+    @property
+    def is_opened(self) -> bool:
+        return False
+
+    def release(self):
+        pass
+
+
+class VideoFileSource(FrameSource):
+    # cv2.VideoCapture; seeks are frame accurate once the keyframe index is loaded in the background
+    def __init__(self, path: str, seekable: bool = True):
+        self._path = path
+        self._cap = cv2.VideoCapture(path)
+        self._position = 0
+        self._frame_index: Optional[FrameIndex] = None
+        if seekable:
+            threading.Thread(target=self._load_index, daemon=True).start()
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def fps(self) -> float:
+        return self._cap.get(cv2.CAP_PROP_FPS)
+
+    @property
+    def frame_count(self) -> int:
+        return int(self._cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    @property
+    def frame_size(self) -> Tuple[int, int]:
+        return int(self._cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(self._cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+    @property
+    def position(self) -> int:
+        return self._position
+
+    @property
+    def frame_index(self) -> Optional[FrameIndex]:
+        return self._frame_index
+
+    @property
+    def is_opened(self) -> bool:
+        # The frame count of streams and some containers is unknown (0) while the capture reads fine
+        return self._cap.isOpened()
+
+    def keyframe_before(self, index: int) -> int:
+        return self._frame_index.keyframe_before(index) if self._frame_index is not None else index
+
+    def seek(self, index: int):
+        # Jumps to the keyframe at or before index and reads forward from there,
+        # or just reads forward when index is ahead in the same GOP
+        if index == self._position:
+            return
+        keyframe = self.keyframe_before(index)
+        if not keyframe <= self._position < index:
+            self._cap.set(cv2.CAP_PROP_POS_FRAMES, keyframe)
+            self._position = keyframe
+        while self._position < index and self._cap.grab():
+            self._position += 1
+
+    def read(self, bgr: Optional[np.ndarray] = None) -> Tuple[bool, Optional[np.ndarray]]:
+        ret, bgr = self._cap.read(bgr)
+        if ret:
+            self._position += 1
+        else:
+            # Unknown after a failed read, the next seek moves the capture
+            self._position = -1
+        return ret, bgr
+
+    def release(self):
+        self._cap.release()
+
+    def _load_index(self):
+        self._frame_index = FrameIndex.load_or_build(self._path)
+
+
+class ImageSequenceSource(FrameSource):
+    # A directory of numbered images; frames ahead of the position are decoded in parallel
+    # (cv2.imdecode releases the GIL), any frame can be read directly
+    DEFAULT_FPS = 30.0
+    PREFETCH = 16
+
+    def __init__(self, path: str, fps: float = DEFAULT_FPS, n_threads: Optional[int] = None,
+                 prefetch: int = PREFETCH):
+        self._path = path
+        # Natural order: 2.jpg before 10.jpg when the numbers are not zero padded
+        self._files: List[str] = [os.path.join(path, name)
+                                  for name in sorted(os.listdir(path), key=ImageSequenceSource._natural_key)
+                                  if name.lower().endswith(FrameSource.IMAGE_EXTENSIONS)]
+        self._fps = fps
+        self._prefetch = prefetch
+        self._position = 0
+
+        self._pool = ThreadPoolExecutor(max_workers=n_threads or os.cpu_count(), thread_name_prefix="ImageDecoder")
+        self._pending: Dict[int, Future] = {}
+
+        first = ImageSequenceSource._decode(self._files[0]) if self._files else None
+        self._frame_size = (first.shape[1], first.shape[0]) if first is not None else (0, 0)
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def fps(self) -> float:
+        return self._fps
+
+    @property
+    def frame_count(self) -> int:
+        return len(self._files)
+
+    @property
+    def frame_size(self) -> Tuple[int, int]:
+        return self._frame_size
+
+    @property
+    def position(self) -> int:
+        return self._position
+
+    @property
+    def is_opened(self) -> bool:
+        return bool(self._files)
+
+    def seek(self, index: int):
+        self._position = index
+        # Prefetched frames outside the new window are not needed anymore
+        for pending_index in list(self._pending):
+            if not index <= pending_index < index + self._prefetch:
+                self._pending.pop(pending_index).cancel()
+
+    def read(self, bgr: Optional[np.ndarray] = None) -> Tuple[bool, Optional[np.ndarray]]:
+        if not 0 <= self._position < len(self._files):
+            return False, bgr
+        for index in range(self._position, min(self._position + self._prefetch, len(self._files))):
+            if index not in self._pending:
+                self._pending[index] = self._pool.submit(ImageSequenceSource._decode, self._files[index])
+
+        frame = self._pending.pop(self._position).result()
+        if frame is None:
+            print(f"[Error] Cannot decode {self._files[self._position]}")
+            return False, bgr
+        self._position += 1
+        return True, frame
+
+    def release(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self._pending.clear()
+
+    @staticmethod
+    def _natural_key(name: str) -> list:
+        return [(0, int(part), "") if part.isdigit() else (1, 0, part) for part in re.split(r"(\d+)", name)]
+
+    @staticmethod
+    def _decode(path: str) -> Optional[np.ndarray]:
+        return cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_COLOR)
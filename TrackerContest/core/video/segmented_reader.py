@@ -0,0 +1,163 @@
+import multiprocessing
+import queue
+import weakref
+from multiprocessing.shared_memory import SharedMemory
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from TrackerContest.core.video.frame_index import FrameIndex
+
+
+class SegmentedReader:
+    # Offline reader: the video is cut at keyframes into segments decoded in parallel by worker processes.
+    # Segment k goes to worker k % n_workers, which decodes into its own shared memory slots; frames are
+    # handed out in order, the slots of all workers together form the reorder window
+    READY_TIMEOUT = 30.0
+
+    def __init__(self, file_path: str, n_workers: int = 4, slots_per_worker: int = 32):
+        self._file_path = file_path
+
+        cap = cv2.VideoCapture(file_path)
+        if not cap.isOpened():
+            raise IOError(f"Cannot open video {file_path}")
+        self._shape = (int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), 3)
+        cap.release()
+
+        index = FrameIndex.load_or_build(file_path)
+        # Without keyframes the video cannot be cut, a single worker decodes it all
+        if index is None:
+            n_workers = 1
+        self._segments = SegmentedReader.split(index, slots_per_worker // 2) if index is not None else [(0, None)]
+        self._n_workers = max(1, min(n_workers, len(self._segments)))
+        self._slots_per_worker = slots_per_worker
+
+        context = multiprocessing.get_context("spawn")
+        frame_nbytes = int(np.prod(self._shape))
+        self._memories: List[SharedMemory] = []
+        self._free: list = []
+        self._ready: list = []
+        self._workers: list = []
+        # Running iterations, closed before the shared memory their frames are views of
+        self._iterations = weakref.WeakSet()
+        try:
+            self._start_workers(context, frame_nbytes)
+        except BaseException:
+            self.close()
+            raise
+
+    def _start_workers(self, context, frame_nbytes: int):
+        for worker in range(self._n_workers):
+            memory = SharedMemory(create=True, size=frame_nbytes * self._slots_per_worker)
+            self._memories.append(memory)
+            free, ready = context.Queue(), context.Queue()
+            for slot in range(self._slots_per_worker):
+                free.put(slot)
+            process = context.Process(target=_decode_segments, daemon=True, name=f"SegmentDecoder-{worker}",
+                                      args=(self._file_path, self._segments[worker::self._n_workers], memory.name,
+                                            self._shape, free, ready))
+            self._free.append(free)
+            self._ready.append(ready)
+            self._workers.append(process)
+        for process in self._workers:
+            process.start()
+
+    @staticmethod
+    def split(index: FrameIndex, min_frames: int) -> List[Tuple[int, Optional[int]]]:
+        # (first frame, frame count) per segment, whole GOPs of at least min_frames frames; the last one
+        # runs to the end of the video
+        segments = []
+        start = 0
+        for keyframe in index.keyframes[1:]:
+            if keyframe - start >= min_frames:
+                segments.append((start, keyframe - start))
+                start = keyframe
+        segments.append((start, None))
+        return segments
+
+    @property
+    def n_workers(self) -> int:
+        return self._n_workers
+
+    @property
+    def n_segments(self) -> int:
+        return len(self._segments)
+
+    @property
+    def frame_shape(self) -> tuple:
+        return self._shape
+
+    def __iter__(self):
+        # (frame index, frame); the frame is a view of shared memory, valid until the next one is requested
+        iteration = self._iterate()
+        self._iterations.add(iteration)
+        return iteration
+
+    def _iterate(self):
+        frames = [np.ndarray((self._slots_per_worker,) + self._shape, dtype=np.uint8, buffer=memory.buf)
+                  for memory in self._memories]
+        try:
+            for segment, (start, n_frames) in enumerate(self._segments):
+                worker = segment % self._n_workers
+                index = start
+                while n_frames is None or index < start + n_frames:
+                    try:
+                        slot = self._ready[worker].get(timeout=SegmentedReader.READY_TIMEOUT)
+                    except queue.Empty:
+                        raise IOError(f"Decoder {worker} stalled at frame {index}")
+                    if slot is None:
+                        if n_frames is not None:
+                            raise IOError(f"Segment at frame {start} ended early at frame {index}")
+                        break
+                    yield index, frames[worker][slot]
+                    self._free[worker].put(slot)
+                    index += 1
+        finally:
+            # Views must be gone before the shared memory is closed, also when the iteration is closed early
+            del frames
+
+    def close(self):
+        for iteration in list(self._iterations):
+            iteration.close()
+        for process in self._workers:
+            if process.is_alive():
+                process.terminate()
+        for process in self._workers:
+            if process.pid is not None:
+                process.join()
+        for memory in self._memories:
+            try:
+                memory.close()
+            except BufferError:
+                # A frame is still referenced, e.g. by the traceback of an error during the evaluation;
+                # the mapping goes away with it
+                pass
+            memory.unlink()
+        self._memories.clear()
+        self._workers.clear()
+
+
+def _decode_segments(file_path: str, segments: list, memory_name: str, shape: tuple,
+                     free: multiprocessing.Queue, ready: multiprocessing.Queue):
+    # Worker process: decodes its segments in order and puts a slot index per frame on ready,
+    # None when the video ends or a segment cannot be read to its end
+    memory = SharedMemory(name=memory_name)
+    slots = np.ndarray((memory.size // int(np.prod(shape)),) + shape, dtype=np.uint8, buffer=memory.buf)
+    cap = cv2.VideoCapture(file_path)
+    bgr = None
+    for start, n_frames in segments:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        decoded = 0
+        while n_frames is None or decoded < n_frames:
+            ret, bgr = cap.read(bgr)
+            if not ret or bgr.shape != shape:
+                break
+            slot = free.get()
+            cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB, dst=slots[slot])
+            ready.put(slot)
+            decoded += 1
+        if n_frames is None or decoded < n_frames:
+            ready.put(None)
+            break
+    cap.release()
@@ -1,18 +1,35 @@
+import collections
 import threading
 import time
 from typing import Optional
 
 import cv2
+import numpy as np
 
 from TrackerContest.core import Bus
+from TrackerContest.core.video.decoded_cache import DecodedCache, DecodedVideo
+from TrackerContest.core.video.frame_cache import FrameCache
+from TrackerContest.core.video.frame_index import FrameIndex
+from TrackerContest.core.video.frame_source import FrameSource, VideoFileSource
+from TrackerContest.core.video.frame_pool import FramePool
 
 
 class VideoPlayer:
     ROI_SELECTION_WINDOW_NAME = "Select ROI"
     VIDEO_SHIFT = 10
 
-    def __init__(self, queue_size=2000):
-        self._cap: Optional[cv2.VideoCapture] = None
+    # Late frames are either dropped to keep real time, or delay the clock (lockstep evaluation)
+    POLICY_DROP = "drop"
+    POLICY_SLOW_DOWN = "slow-down"
+    FPS_WINDOW = 30
+    # Late frames dropped in a row at most, the next one is shown late and the clock restarts from it
+    MAX_DROPS = 10
+    # Seconds between update-player-stats events
+    STATS_INTERVAL = 1.0
+
+    def __init__(self, queue_size=2000, queue_memory_mb=512, policy=POLICY_SLOW_DOWN,
+                 cache_memory_mb=256, pool_memory_mb=768, decoded_cache: Optional[DecodedCache] = None):
+        self._source: Optional[FrameSource] = None
         self._fps: int = 0
         self._frame_size: Optional[tuple[int]] = None
 
@@ -20,7 +37,46 @@ class VideoPlayer:
         self._paused = True
         self._current_frame = 0
 
+        # Decoded frames ready to be published: (frame, nf), frame is None at the end of the video
+        self._queue_size = queue_size
+        self._queue_memory = queue_memory_mb << 20
+        self._queue = collections.deque()
+        self._queue_nbytes = 0
+        self._queue_cond = threading.Condition()
+        self._underruns = 0
+
+        # Guards the source; a flush bumps the epoch so frames decoded before it are dropped
         self._frame_lock = threading.Lock()
+        self._epoch = 0
+        self._decoded_frame = 0
+        # Index the decoder reads next, the source is moved there lazily
+        self._next_index = 0
+
+        # Recently decoded frames for scrubbing
+        self._frame_cache = FrameCache(cache_memory_mb << 20)
+
+        # Decoded frames live in pooled buffers; a published frame is released once new-frame returned,
+        # subscribers keeping it longer retain it. The decoder reads into one reused BGR buffer
+        self._frame_pool = FramePool(pool_memory_mb << 20)
+        self._bgr: Optional[np.ndarray] = None
+
+        # Videos decoded once into memory mapped files; once available frames are copied from there
+        self._decoded_cache = decoded_cache
+        self._decoded: Optional[DecodedVideo] = None
+
+        # Presentation clock: frame nf is due at clock_start + (nf - clock_nf) / fps
+        self._policy = policy
+        self._clock_start = 0.0
+        self._clock_nf: Optional[int] = None
+        self._dropped_frames = 0
+        self._drops_in_row = 0
+        self._presented = collections.deque(maxlen=VideoPlayer.FPS_WINDOW)
+        self._stats_time = 0.0
+
+        self._decode_thread = threading.Thread(target=self._decode_frames)
+        self._decode_thread.daemon = True
+        self._decode_thread.start()
+
         self._frame_thread = threading.Thread(target=self._load_frames)
         self._frame_thread.daemon = True
         self._frame_thread.start()
@@ -28,9 +84,18 @@ class VideoPlayer:
         Bus.subscribe("set-fps", self.set_fps)
 
     def init_video(self, file_path: str):
-        self._cap = cv2.VideoCapture(file_path)
-        self._fps = int(self._cap.get(cv2.CAP_PROP_FPS))
-        self._frame_size = (int(self._cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(self._cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        with self._frame_lock:
+            if self._source:
+                self._source.release()
+            # A video file or a directory of images
+            self._source = FrameSource.open(file_path)
+            self._fps = int(self._source.fps)
+            self._frame_size = self._source.frame_size
+            self._frame_cache.clear()
+            self._decoded = None
+            self._flush(0)
+        if self._decoded_cache is not None and isinstance(self._source, VideoFileSource):
+            threading.Thread(target=self._load_decoded, args=(file_path, self._source), daemon=True).start()
         self.start()
         Bus.publish("set-init-fps", self._fps)
 
@@ -38,6 +103,30 @@ class VideoPlayer:
     def fps(self) -> int:
         return self._fps
 
+    @property
+    def frame_count(self) -> int:
+        return self._source.frame_count if self._source else 0
+
+    @property
+    def source(self) -> Optional[FrameSource]:
+        return self._source
+
+    @property
+    def frame_index(self) -> Optional[FrameIndex]:
+        return self._source.frame_index if isinstance(self._source, VideoFileSource) else None
+
+    @property
+    def frame_cache(self) -> FrameCache:
+        return self._frame_cache
+
+    @property
+    def decoded(self) -> bool:
+        return self._decoded is not None
+
+    @property
+    def frame_pool(self) -> FramePool:
+        return self._frame_pool
+
     @property
     def frame_size(self) -> tuple[int]:
         return self._frame_size
@@ -50,8 +139,49 @@ class VideoPlayer:
     def on_playing(self) -> bool:
         return self._playing
 
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    @property
+    def queue_nbytes(self) -> int:
+        return self._queue_nbytes
+
+    @property
+    def queue_size(self) -> int:
+        return self._queue_size
+
+    @property
+    def policy(self) -> str:
+        return self._policy
+
+    @policy.setter
+    def policy(self, policy: str):
+        self._policy = policy
+        self._clock_nf = None
+
+    @property
+    def target_fps(self) -> int:
+        return self._fps
+
+    @property
+    def achieved_fps(self) -> float:
+        if len(self._presented) < 2 or self._presented[-1] <= self._presented[0]:
+            return 0.0
+        return (len(self._presented) - 1) / (self._presented[-1] - self._presented[0])
+
+    @property
+    def dropped_frames(self) -> int:
+        return self._dropped_frames
+
+    @property
+    def underruns(self) -> int:
+        # Times the player was due to publish a frame but the decoder had none ready
+        return self._underruns
+
     def set_fps(self, fps: int):
         self._fps = fps
+        self._clock_nf = None
 
     def set_frame_size(self, frame_size: tuple[int]):
         self._frame_size = frame_size
@@ -59,51 +189,200 @@ class VideoPlayer:
     def start(self):
         self._playing = True
         self._paused = False
+        self._clock_nf = None
+        self._presented.clear()
+        self._notify()
 
     def pause(self):
         self._paused = True
 
     def stop(self):
-        self._playing = False
-        self._paused = False
-        if self._cap:
-            self._cap.release()
+        with self._frame_lock:
+            self._playing = False
+            self._paused = False
+            self._flush(0)
+            if self._source:
+                self._source.release()
 
     def restart(self):
-        self._cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        with self._frame_lock:
+            self._flush(0)
 
     def seek(self, shift: int):
+        # The decoder moves the source itself when it reads next, repeated seeks only flush
         target_frame = int(self._current_frame + shift)
         if target_frame < 0:
             target_frame = 0
-        if target_frame >= self._cap.get(cv2.CAP_PROP_FRAME_COUNT):
-            target_frame = self._cap.get(cv2.CAP_PROP_FRAME_COUNT)
-        start = True
-        if self._paused:
-            start = False
-        else:
-            self.pause()
-        self._cap.set(cv2.CAP_PROP_POS_FRAMES, target_frame)
-        self._current_frame = target_frame
-        if start:
-            self.start()
-        else:
-            ret, frame = self._cap.read()
+        with self._frame_lock:
+            if target_frame >= self._source.frame_count:
+                target_frame = self._source.frame_count
+            self._current_frame = target_frame
+            # Paused: show the frame sought to right away, numbered like the decoder numbers it
+            frame = self._read_at(target_frame) if self._paused else None
+            if frame is not None:
+                self._current_frame += 1
+            self._flush(self._current_frame)
+        if frame is None:
+            return
+        # Subscribers may draw on the frame, the cached one stays clean
+        Bus.publish("new-frame", frame.copy(), self._current_frame)
+
+    def _load_decoded(self, file_path: str, source: FrameSource):
+        # Cached by an earlier run, or decoded into the cache now in the background
+        decoded = self._decoded_cache.get(file_path)
+        with self._frame_lock:
+            width, height = source.frame_size
+            if source is self._source and decoded is not None and decoded.frame_shape == (height, width, 3):
+                self._decoded = decoded
+
+    def _read_at(self, index: int):
+        # Called with _frame_lock held. Frames read on the way to index are cached for scrubbing back
+        if self._decoded is not None:
+            return self._decoded.frame(index)
+        frame = self._frame_cache.get(index)
+        if frame is not None:
+            return frame
+
+        keyframe = self._source.keyframe_before(index)
+        if not keyframe <= self._source.position <= index:
+            self._source.seek(keyframe)
+        while self._source.position <= index:
+            position = self._source.position
+            ret, frame = self._source.read()
             if not ret:
-                return
+                return None
             frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            Bus.publish("new-frame", frame, self._current_frame)
+            self._frame_cache.put(position, frame)
+        return frame
+
+    def _flush(self, nf: int, index: Optional[int] = None):
+        # Called with _frame_lock held
+        with self._queue_cond:
+            self._epoch += 1
+            self._decoded_frame = nf
+            self._next_index = nf if index is None else index
+            for frame, _ in self._queue:
+                self._frame_pool.release(frame)
+            self._queue.clear()
+            self._queue_nbytes = 0
+            self._clock_nf = None
+            self._presented.clear()
+            self._queue_cond.notify_all()
+
+    def _notify(self):
+        with self._queue_cond:
+            self._queue_cond.notify_all()
+
+    def _queue_full(self) -> bool:
+        return len(self._queue) >= self._queue_size or self._queue_nbytes >= self._queue_memory
+
+    def _decode_frames(self):
+        while True:
+            with self._queue_cond:
+                self._queue_cond.wait_for(lambda: self._playing and not self._paused and self._source is not None
+                                          and not self._queue_full())
+
+            with self._frame_lock:
+                if not self._playing or self._paused:
+                    continue
+                epoch = self._epoch
+                mapped = None
+                if self._decoded is not None:
+                    mapped = self._decoded.frame(self._next_index)
+                    ret = mapped is not None
+                else:
+                    self._source.seek(self._next_index)
+                    ret, self._bgr = self._source.read(self._bgr)
+                if ret:
+                    self._decoded_frame += 1
+                    self._next_index += 1
+                else:
+                    # Loop from the start, frame numbers keep counting
+                    self._next_index = 0
+                nf = self._decoded_frame
+
+            frame = None
+            if mapped is not None:
+                frame = self._frame_pool.copy(mapped)
+            elif ret:
+                frame = self._frame_pool.acquire(self._bgr.shape)
+                cv2.cvtColor(self._bgr, cv2.COLOR_BGR2RGB, dst=frame)
+
+            with self._queue_cond:
+                if epoch != self._epoch:
+                    self._frame_pool.release(frame)
+                    continue
+                self._queue.append((frame, nf))
+                self._queue_nbytes += frame.nbytes if frame is not None else 0
+                self._queue_cond.notify_all()
+
+    def _next_frame(self) -> Optional[tuple]:
+        with self._queue_cond:
+            if not self._queue:
+                self._underruns += 1
+                self._queue_cond.wait_for(lambda: self._queue or not self._playing or self._paused, 0.1)
+            if not self._queue or not self._playing or self._paused:
+                return None
+            frame, nf = self._queue.popleft()
+            self._queue_nbytes -= frame.nbytes if frame is not None else 0
+            self._queue_cond.notify_all()
+            return frame, nf, self._epoch
+
+    def _wait_until(self, deadline: float, epoch: int) -> bool:
+        # Sleeps until the deadline, False if the player was paused, stopped or flushed meanwhile
+        with self._queue_cond:
+            self._queue_cond.wait_for(lambda: self._epoch != epoch or self._paused or not self._playing,
+                                      max(0.0, deadline - time.monotonic()))
+            return self._epoch == epoch and self._playing and not self._paused
+
+    def _present(self, frame, nf: int, epoch: int):
+        period = 1 / self._fps
+        now = time.monotonic()
+        if self._clock_nf is None:
+            self._clock_start, self._clock_nf = now, nf
+        deadline = self._clock_start + (nf - self._clock_nf) * period
+
+        if now < deadline:
+            if not self._wait_until(deadline, epoch):
+                return
+        elif now - deadline >= period:
+            # Dropping only helps to catch up with frames already decoded; with the decoder behind, the
+            # frame is shown and the clock restarts from it, so later frames are not all late too
+            if self._policy == VideoPlayer.POLICY_DROP and self._queue and \
+                    self._drops_in_row < VideoPlayer.MAX_DROPS:
+                self._dropped_frames += 1
+                self._drops_in_row += 1
+                return
+            # Slow down: shift the clock instead of catching up with a burst of frames
+            self._clock_start, self._clock_nf = now, nf
+
+        self._drops_in_row = 0
+        self._current_frame = nf
+        self._presented.append(time.monotonic())
+        Bus.publish("new-frame", frame, self._current_frame)
+        self._publish_stats()
+
+    def _publish_stats(self):
+        # Achieved vs target fps, frames dropped to keep real time, and times the decoder fell behind
+        now = time.monotonic()
+        if now - self._stats_time < VideoPlayer.STATS_INTERVAL:
+            return
+        self._stats_time = now
+        Bus.publish("update-player-stats", self.achieved_fps, self._fps, self._dropped_frames, self._underruns)
+        Bus.publish("update-frame-pool-stats", self._frame_pool.n_buffers, self._frame_pool.nbytes,
+                    self._frame_pool.hit_rate)
 
     def _load_frames(self):
         while True:
             if self._playing and not self._paused:
-                ret, frame = self._cap.read()
-                if not ret:
-                    self._cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                item = self._next_frame()
+                if item is None:
                     continue
-                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                self._current_frame += 1
-                Bus.publish("new-frame", frame, self._current_frame)
-                time.sleep(1 / self._fps)
+                frame, nf, epoch = item
+                if frame is None:
+                    Bus.publish("end-of-video", nf)
+                    continue
+                self._present(frame, nf, epoch)
+                self._frame_pool.release(frame)
             else:
                 time.sleep(0.1)
@@ -0,0 +1,201 @@
+import json
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Optional
+
+from TrackerContest.core.network import TrackerBroker
+from TrackerContest.core.video import FrameSource, DecodedCache
+from TrackerContest.evaluation import Evaluation
+
+
+class Sequence:
+    def __init__(self, name: str, video_path: str, gt_path: str):
+        self._name = name
+        self._video_path = video_path
+        self._gt_path = gt_path
+        self._n_frames = Sequence._count_frames(video_path)
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def video_path(self) -> str:
+        return self._video_path
+
+    @property
+    def gt_path(self) -> str:
+        return self._gt_path
+
+    @property
+    def n_frames(self) -> int:
+        return self._n_frames
+
+    @staticmethod
+    def _count_frames(video_path: str) -> int:
+        source = FrameSource.open(video_path, seekable=False)
+        n_frames = source.frame_count
+        source.release()
+        return max(n_frames, 0)
+
+
+class DatasetRunner:
+    # Evaluates every sequence of a dataset, one process per sequence with its own decoder, broker and trackers
+    GT_FILE = "groundtruth.txt"
+    REPORT_FILE = "report.json"
+
+    def __init__(self, dataset_dir: str, output_dir: str, tracker_commands: List[str],
+                 n_workers: Optional[int] = None, tracker_backend: str = TrackerBroker.BACKEND_THREADS,
+                 connect_timeout: float = 60.0, decoded_cache: Optional[DecodedCache] = None,
+                 tracking_mode: str = TrackerBroker.MODE_LOCKSTEP, async_tracking: bool = False):
+        self._dataset_dir = dataset_dir
+        self._output_dir = output_dir
+        self._tracker_commands = tracker_commands
+        self._n_workers = n_workers or os.cpu_count()
+        self._tracker_backend = tracker_backend
+        self._connect_timeout = connect_timeout
+        # Handed to the workers as its directory and size limit, each process opens the cache itself
+        self._decoded_cache = decoded_cache
+        self._tracking_mode = tracking_mode
+        self._async_tracking = async_tracking
+
+    def find_sequences(self) -> List[Sequence]:
+        # <name>/ holding one video or the frames as images and groundtruth.txt, or <name>.<video> next to
+        # <name>.txt
+        sequences = []
+        for entry in sorted(os.listdir(self._dataset_dir)):
+            path = os.path.join(self._dataset_dir, entry)
+            if os.path.isdir(path):
+                videos = [f for f in sorted(os.listdir(path)) if f.lower().endswith(FrameSource.VIDEO_EXTENSIONS)]
+                gt_path = os.path.join(path, DatasetRunner.GT_FILE)
+                if not os.path.isfile(gt_path):
+                    continue
+                if videos:
+                    sequences.append(Sequence(entry, os.path.join(path, videos[0]), gt_path))
+                elif FrameSource.is_supported(path):
+                    sequences.append(Sequence(entry, path, gt_path))
+            elif entry.lower().endswith(FrameSource.VIDEO_EXTENSIONS):
+                name = os.path.splitext(entry)[0]
+                gt_path = os.path.join(self._dataset_dir, name + ".txt")
+                if os.path.isfile(gt_path):
+                    sequences.append(Sequence(name, path, gt_path))
+        return sequences
+
+    def is_complete(self, sequence: Sequence) -> bool:
+        # Done with the same tracker commands, and every tracker connected
+        summary = self._load_summary(sequence)
+        if summary is None or summary.get("tracker_commands") != self._tracker_commands:
+            return False
+        return len(summary.get("connected_trackers", ())) >= summary.get("expected_trackers", 1)
+
+    def run(self) -> dict:
+        sequences = self.find_sequences()
+        pending = [sequence for sequence in sequences if not self.is_complete(sequence)]
+        print(f"[INFO] {len(sequences)} sequences, {len(sequences) - len(pending)} already done")
+
+        # Longest first, so a long sequence does not start last and hold up the whole run
+        pending.sort(key=lambda sequence: sequence.n_frames, reverse=True)
+        socket_dir = tempfile.mkdtemp(prefix="trackercontest-")
+        # A fresh process per sequence: the Bus and the broker are per process singletons
+        cache = (self._decoded_cache.cache_dir, self._decoded_cache.max_bytes) \
+            if self._decoded_cache is not None else None
+        with ProcessPoolExecutor(max_workers=self._n_workers, max_tasks_per_child=1) as pool:
+            jobs = {pool.submit(_evaluate_sequence, sequence.video_path, sequence.gt_path,
+                                os.path.join(self._output_dir, sequence.name),
+                                os.path.join(socket_dir, f"{i}.sock"), self._tracker_commands,
+                                self._tracker_backend, self._connect_timeout, cache, self._tracking_mode,
+                                self._async_tracking): sequence
+                    for i, sequence in enumerate(pending)}
+            for job in as_completed(jobs):
+                sequence = jobs[job]
+                try:
+                    job.result()
+                    print(f"[INFO] Done {sequence.name} ({sequence.n_frames} frames)")
+                except Exception as e:
+                    print(f"[Error] Failed {sequence.name}: {e}")
+        try:
+            os.rmdir(socket_dir)
+        except OSError:
+            pass
+
+        return self.merge_report(sequences)
+
+    def merge_report(self, sequences: List[Sequence]) -> dict:
+        # missing: sequences without results, missing_trackers: (tracker, sequence) pairs without results, the
+        # averages of those trackers are over fewer sequences. incomplete: sequences some trackers never connected
+        # to, including trackers that connected to none, whose names are not known
+        report = {"sequences": {}, "trackers": {}, "missing": [], "missing_trackers": [], "incomplete": []}
+        totals = {}
+        for sequence in sequences:
+            summary = self._load_summary(sequence)
+            if summary is None:
+                report["missing"].append(sequence.name)
+                continue
+            report["sequences"][sequence.name] = summary
+            n_connected = len(summary.get("connected_trackers", summary["trackers"]))
+            if n_connected < summary.get("expected_trackers", 0):
+                report["incomplete"].append({"sequence": sequence.name, "expected": summary["expected_trackers"],
+                                             "connected": n_connected})
+
+            for name, tracker in summary["trackers"].items():
+                total = totals.setdefault(name, {"sequences": 0, "frames": 0, "tracked_frames": 0,
+                                                 "skipped_frames": 0, "tracking_time": 0.0, "iou_sum": 0.0,
+                                                 "iou_frames": 0, "realtime_iou_sum": 0.0,
+                                                 "realtime_iou_frames": 0})
+                total["sequences"] += 1
+                total["frames"] += summary["frames"]
+                total["tracked_frames"] += tracker["tracked_frames"]
+                total["skipped_frames"] += tracker.get("skipped_frames", 0)
+                if tracker["mean_latency"] is not None:
+                    total["tracking_time"] += tracker["mean_latency"] * tracker["tracked_frames"]
+                if tracker.get("mean_iou") is not None:
+                    # Weighted by sequence length
+                    total["iou_sum"] += tracker["mean_iou"] * summary["frames"]
+                    total["iou_frames"] += summary["frames"]
+                if tracker.get("realtime_iou") is not None:
+                    total["realtime_iou_sum"] += tracker["realtime_iou"] * summary["frames"]
+                    total["realtime_iou_frames"] += summary["frames"]
+
+        for sequence in sequences:
+            summary = report["sequences"].get(sequence.name)
+            for name in totals:
+                if summary is None or name not in summary["trackers"]:
+                    report["missing_trackers"].append([name, sequence.name])
+        if report["missing_trackers"] or report["incomplete"]:
+            print(f"[Error] Some trackers have no results on some sequences, see {DatasetRunner.REPORT_FILE}")
+
+        for name, total in totals.items():
+            report["trackers"][name] = {
+                "sequences": total["sequences"],
+                "frames": total["frames"],
+                "skipped_frames": total["skipped_frames"],
+                "mean_iou": total["iou_sum"] / total["iou_frames"] if total["iou_frames"] else None,
+                "realtime_iou": total["realtime_iou_sum"] / total["realtime_iou_frames"]
+                if total["realtime_iou_frames"] else None,
+                "fps": total["tracked_frames"] / total["tracking_time"] if total["tracking_time"] > 0 else None}
+
+        os.makedirs(self._output_dir, exist_ok=True)
+        with open(os.path.join(self._output_dir, DatasetRunner.REPORT_FILE), "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[INFO] Report written to {os.path.join(self._output_dir, DatasetRunner.REPORT_FILE)}")
+        return report
+
+    def _load_summary(self, sequence: Sequence) -> Optional[dict]:
+        try:
+            with open(os.path.join(self._output_dir, sequence.name, Evaluation.SUMMARY_FILE), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+
+def _evaluate_sequence(video_path: str, gt_path: str, output_dir: str, socket_path: str,
+                       tracker_commands: List[str], tracker_backend: str, connect_timeout: float,
+                       cache: Optional[tuple] = None, tracking_mode: str = TrackerBroker.MODE_LOCKSTEP,
+                       async_tracking: bool = False) -> dict:
+    evaluation = Evaluation(video_path, output_dir, gt_path=gt_path, socket_path=socket_path,
+                            tracker_backend=tracker_backend, connect_timeout=connect_timeout,
+                            tracker_commands=tracker_commands,
+                            decoded_cache=DecodedCache(*cache) if cache is not None else None,
+                            tracking_mode=tracking_mode, async_tracking=async_tracking)
+    return evaluation.run()
@@ -0,0 +1,261 @@
+import json
+import os
+import re
+import subprocess
+import time
+from typing import Optional, List
+
+import cv2
+import numpy as np
+
+from TrackerContest.core import Bus
+from TrackerContest.core.network import TrackerBroker
+from TrackerContest.core.video import SegmentedReader, DecodedCache, FrameSource, VideoFileSource, FramePool
+
+
+class Evaluation:
+    # Headless contest run: every connected tracker gets every frame of the video as fast as they answer
+    CONNECT_POLL = 0.1
+    # Placeholder for the server socket path in tracker commands, also exported as TRACKER_SOCKET
+    SOCKET_PLACEHOLDER = "{socket}"
+    TRACKER_STOP_TIMEOUT = 5.0
+    SUMMARY_FILE = "summary.json"
+
+    def __init__(self, video_path: str, output_dir: str, init_bbox: Optional[tuple] = None,
+                 gt_path: Optional[str] = None, socket_path: str = "/tmp/server_socket",
+                 tcp_address: Optional[str] = None, tracker_backend: str = TrackerBroker.BACKEND_THREADS,
+                 n_trackers: Optional[int] = None, connect_timeout: float = 60.0,
+                 tracker_commands: Optional[List[str]] = None, decode_workers: int = 1,
+                 decoded_cache: Optional[DecodedCache] = None, tracking_mode: str = TrackerBroker.MODE_LOCKSTEP,
+                 async_tracking: bool = False):
+        self._video_path = video_path
+        self._output_dir = output_dir
+        self._gt = Evaluation.load_bboxes(gt_path) if gt_path else None
+        if init_bbox is None and self._gt is None:
+            raise ValueError("An initial bbox or a ground truth file is required")
+        self._init_bbox = tuple(init_bbox) if init_bbox is not None else tuple(self._gt[0])
+
+        self._socket_path = socket_path
+        self._tracker_commands = tracker_commands or []
+        self._tracker_processes: List[subprocess.Popen] = []
+        self._n_trackers = n_trackers if n_trackers is not None else max(1, len(self._tracker_commands))
+        self._connect_timeout = connect_timeout
+        # More than one: the video is decoded by a SegmentedReader in as many processes
+        self._decode_workers = decode_workers
+        # Decodes the video once for all later runs, which then read it from a memory mapped file
+        self._decoded_cache = decoded_cache
+
+        # Not waiting for the trackers, frames are copied into pooled buffers they hold until done: the readers
+        # decode into reused buffers. Real-time also feeds the frames at the video frame rate
+        self._async_tracking = async_tracking or tracking_mode == TrackerBroker.MODE_REALTIME
+        self._frame_pool = FramePool() if self._async_tracking else None
+        self._tracker_broker = TrackerBroker(socket_path, backend=tracker_backend, mode=tracking_mode,
+                                             tcp_address=tcp_address, frame_pool=self._frame_pool)
+        Bus.subscribe("error-tracking", self._tracker_broker.remove_tracker)
+
+    @staticmethod
+    def load_bboxes(path: str) -> np.ndarray:
+        # One "x,y,w,h" per line, comma, tab or space separated
+        rows = []
+        with open(path, "r") as f:
+            for line_number, line in enumerate(f, 1):
+                values = [v for v in re.split(r"[,\s]+", line.strip()) if v]
+                if not values:
+                    continue
+                try:
+                    if len(values) < 4:
+                        raise ValueError(f"expected x,y,w,h, got {len(values)} values")
+                    rows.append([float(v) for v in values[:4]])
+                except ValueError as e:
+                    raise ValueError(f"Bad bbox in {path} line {line_number}: {e}") from None
+        return np.array(rows, dtype=np.float32).reshape(-1, 4)
+
+    def run(self) -> dict:
+        source = FrameSource.open(self._video_path, seekable=False)
+        if not source.is_opened:
+            source.release()
+            raise IOError(f"Cannot open video {self._video_path}")
+        reader = None
+        try:
+            # Decoded cache and segmented decoding apply to video files only
+            is_video = isinstance(source, VideoFileSource)
+            decoded = self._decoded_cache.get(self._video_path) \
+                if self._decoded_cache is not None and is_video else None
+            reader = SegmentedReader(self._video_path, self._decode_workers) \
+                if self._decode_workers > 1 and is_video and decoded is None else None
+            if decoded is not None:
+                frames = ((index, decoded.frame(index)) for index in range(decoded.frame_count))
+            elif reader is not None:
+                frames = iter(reader)
+            else:
+                frames = self._read_frames(source)
+
+            self._tracker_broker.setup_server()
+            self._start_trackers()
+            self._wait_trackers()
+            return self._evaluate(source.frame_count, source.fps, frames)
+        finally:
+            source.release()
+            if reader is not None:
+                reader.close()
+            Bus.unsubscribe("error-tracking", self._tracker_broker.remove_tracker)
+            self._tracker_broker.close()
+            self._stop_trackers()
+
+    def _start_trackers(self):
+        if not self._tracker_commands:
+            return
+        os.makedirs(self._output_dir, exist_ok=True)
+        env = dict(os.environ, TRACKER_SOCKET=self._socket_path)
+        with open(os.path.join(self._output_dir, "trackers.log"), "ab") as log:
+            for command in self._tracker_commands:
+                self._tracker_processes.append(subprocess.Popen(
+                    command.replace(Evaluation.SOCKET_PLACEHOLDER, self._socket_path), shell=True, env=env,
+                    stdout=log, stderr=subprocess.STDOUT))
+
+    def _stop_trackers(self):
+        for process in self._tracker_processes:
+            process.terminate()
+        for process in self._tracker_processes:
+            try:
+                process.wait(Evaluation.TRACKER_STOP_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        self._tracker_processes.clear()
+
+    def _wait_trackers(self):
+        deadline = time.monotonic() + self._connect_timeout
+        while self._tracker_broker.num_clients < self._n_trackers and time.monotonic() < deadline:
+            if self._tracker_processes and all(p.poll() is not None for p in self._tracker_processes):
+                break
+            time.sleep(Evaluation.CONNECT_POLL)
+        if self._tracker_broker.num_clients == 0:
+            raise TimeoutError(f"No tracker connected within {self._connect_timeout} s")
+        if self._tracker_broker.num_clients < self._n_trackers:
+            print(f"[Error] Only {self._tracker_broker.num_clients} of {self._n_trackers} trackers connected")
+        print(f"[INFO] Evaluating {self._tracker_broker.num_clients} trackers on {self._video_path}")
+
+    @staticmethod
+    def _read_frames(source: FrameSource):
+        # (frame index, frame), decoded into the same buffers every time
+        bgr, frame = None, None
+        index = 0
+        while True:
+            ret, bgr = source.read(bgr)
+            if not ret:
+                return
+            if frame is None or frame.shape != bgr.shape:
+                frame = np.empty_like(bgr)
+            cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB, dst=frame)
+            yield index, frame
+            index += 1
+
+    def _evaluate(self, frame_count: int, fps: float, frames) -> dict:
+        self._tracker_broker.reserve_frames(frame_count + 1)
+        clients = self._tracker_broker.clients
+        period = 1 / fps if self._tracker_broker.mode == TrackerBroker.MODE_REALTIME and fps > 0 else 0.0
+        clock = 0.0
+
+        # Frames are numbered from 1 like in the player; trackers are initialized on frame 1
+        decode_time = 0.0
+        nf = 0
+        start = time.perf_counter()
+        while True:
+            t = time.perf_counter()
+            index, frame = next(frames, (None, None))
+            if frame is None:
+                break
+            decode_time += time.perf_counter() - t
+            nf = index + 1
+
+            if nf == 1:
+                self._tracker_broker.init_all_tracker(frame, self._init_bbox, nf)
+                clock = time.perf_counter()
+            elif self._frame_pool is not None:
+                delay = clock + (nf - 1) * period - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                frame = self._frame_pool.copy(frame)
+                self._tracker_broker.send_frame_all_clients(frame, nf, wait=False)
+                self._frame_pool.release(frame)
+            else:
+                self._tracker_broker.send_frame_all_clients(frame, nf)
+        total_time = time.perf_counter() - start
+        # Trackers get STOP before their processes are terminated
+        self._tracker_broker.stop_tracking()
+
+        return self._write_results(clients, nf, fps, total_time, decode_time)
+
+    def _write_results(self, clients: list, n_frames: int, fps: float, total_time: float,
+                       decode_time: float) -> dict:
+        os.makedirs(self._output_dir, exist_ok=True)
+        results = self._tracker_broker.results
+        rows = [client.results_row for client in clients]
+        bboxes, valid = results.get_range(1, n_frames + 1, rows)
+        latency, _ = results.get_timings(1, n_frames + 1, rows)
+        skipped = results.get_skipped(1, n_frames + 1, rows)
+
+        # Expected and connected trackers: a run some trackers missed is not complete
+        summary = {"video": self._video_path, "frames": n_frames, "video_fps": fps, "total_time": total_time,
+                   "decode_time": decode_time, "tracker_commands": self._tracker_commands,
+                   "expected_trackers": self._n_trackers, "connected_trackers": [client.name for client in clients],
+                   "trackers": {}}
+        for i, client in enumerate(clients):
+            name = re.sub(r"[^\w.-]+", "_", client.name) or f"tracker{i}"
+            tracker_bboxes = np.where(valid[i, :, None], bboxes[i], np.nan)
+            np.savetxt(os.path.join(self._output_dir, f"{name}.txt"), tracker_bboxes, fmt="%.2f", delimiter=",")
+            np.savetxt(os.path.join(self._output_dir, f"{name}_time.txt"), latency[i], fmt="%.6f")
+
+            # Frame 1 holds the init bbox, not a tracker output: left out of the statistics
+            tracked = latency[i][1:][~np.isnan(latency[i][1:])]
+            tracker_summary = {"tracked_frames": int(tracked.size),
+                               "skipped_frames": int(skipped[i][1:].sum()),
+                               "mean_latency": float(tracked.mean()) if tracked.size else None,
+                               "fps": float(tracked.size / tracked.sum()) if tracked.sum() > 0 else None}
+            if self._gt is not None:
+                tracker_summary["mean_iou"] = Evaluation._mean_iou(tracker_bboxes[1:], self._gt[1:])
+                if fps > 0:
+                    shown = Evaluation._realtime_bboxes(tracker_bboxes, latency[i], 1 / fps)
+                    tracker_summary["realtime_iou"] = Evaluation._mean_iou(shown[1:], self._gt[1:])
+            summary["trackers"][client.name] = tracker_summary
+
+        # Written last and atomically: its presence marks the results as complete
+        summary_path = os.path.join(self._output_dir, Evaluation.SUMMARY_FILE)
+        with open(summary_path + ".tmp", "w") as f:
+            json.dump(summary, f, indent=2)
+        os.replace(summary_path + ".tmp", summary_path)
+        print(f"[INFO] Results written to {self._output_dir}")
+        return summary
+
+    @staticmethod
+    def _realtime_bboxes(bboxes: np.ndarray, latency: np.ndarray, period: float) -> np.ndarray:
+        # Latency aware, as in real-time benchmarks: frames come every period, a reply counts for its frame when
+        # it is in before the next one comes, otherwise the newest one in by then is carried over. Frames without a
+        # latency never got a reply of their own (skipped, failed); the first holds the init bbox
+        n = len(bboxes)
+        ready = np.arange(n) * period + np.nan_to_num(latency, nan=np.inf)
+        ready[0] = 0.0
+        # First frame each reply counts for
+        first = np.maximum(np.arange(n), np.ceil(ready / period - 1e-9) - 1)
+        delivered = first < n
+        newest = np.full(n, -1, dtype=np.int64)
+        np.maximum.at(newest, first[delivered].astype(np.int64), np.arange(n)[delivered])
+        newest = np.maximum.accumulate(newest)
+        return np.where((newest >= 0)[:, None], bboxes[np.maximum(newest, 0)], np.nan)
+
+    @staticmethod
+    def _mean_iou(bboxes: np.ndarray, gt: np.ndarray) -> Optional[float]:
+        # Frames without a ground truth are left out, a missing prediction counts as 0
+        n = min(len(bboxes), len(gt))
+        bboxes, gt = bboxes[:n], gt[:n]
+        has_gt = ~np.isnan(gt).any(axis=1)
+        if not has_gt.any():
+            return None
+        x0 = np.maximum(bboxes[:, 0], gt[:, 0])
+        y0 = np.maximum(bboxes[:, 1], gt[:, 1])
+        x1 = np.minimum(bboxes[:, 0] + bboxes[:, 2], gt[:, 0] + gt[:, 2])
+        y1 = np.minimum(bboxes[:, 1] + bboxes[:, 3], gt[:, 1] + gt[:, 3])
+        intersection = np.clip(x1 - x0, 0, None) * np.clip(y1 - y0, 0, None)
+        union = bboxes[:, 2] * bboxes[:, 3] + gt[:, 2] * gt[:, 3] - intersection
+        iou = np.nan_to_num(np.where(union > 0, intersection / np.where(union > 0, union, 1), 0))
+        return float(iou[has_gt].mean())
@@ -1,6 +1,9 @@
 from __future__ import annotations
 
+import os
 import signal
+import threading
+import time
 
 import glfw
 import OpenGL.GL as gl
@@ -8,11 +11,16 @@ import OpenGL.GL as gl
 import imgui
 from imgui.integrations.glfw import GlfwRenderer
 
+from TrackerContest.core import Bus
 from TrackerContest.gui.imgui_fonts import ImGuiFonts
 
 
 class ImGuiApp:
-    def __init__(self, window_width, window_height, fullscreen):
+    # Frames drawn after input before going idle again, ImGui settles hover and release states over a few
+    ACTIVE_FRAMES = 3
+    STATS_INTERVAL = 1.0
+
+    def __init__(self, window_width, window_height, fullscreen, max_ui_fps=60):
         self._window_width = window_width
         self._window_height = window_height
 
@@ -21,6 +29,16 @@ class ImGuiApp:
         self.__window = None
         self.__renderer = None
 
+        # Render scheduling: frames left to draw before waiting for events, and the UI rate limit
+        self._max_ui_fps = max_ui_fps
+        self.__active_frames = ImGuiApp.ACTIVE_FRAMES
+        self.__redraw_requested = threading.Event()
+
+        # Render statistics, published as update-render-stats (UI fps, render CPU ms per second)
+        self.__stats_start = time.monotonic()
+        self.__stats_frames = 0
+        self.__stats_cpu_time = 0.0
+
         self.__init_app()
 
     @staticmethod
@@ -70,7 +88,7 @@ class ImGuiApp:
 
     def __init_app(self):
         # Init interrupt handler
-        InterruptHandler.signal()
+        InterruptHandler.signal(self.request_redraw)
 
         # Create imgui context
         imgui.create_context()
@@ -90,6 +108,8 @@ class ImGuiApp:
                               glfw_window=self.__window)
         self.__renderer.refresh_font_texture()
 
+        Bus.set_gui_wakeup(self.request_redraw)
+
         return self
 
     def __shutdown(self):
@@ -104,6 +124,16 @@ class ImGuiApp:
     def _update(self):
         pass
 
+    def _needs_redraw(self) -> bool:
+        # Subclasses keep the loop drawing while something changes without input, e.g. a pending frame
+        return False
+
+    def request_redraw(self):
+        # Callable from any thread, wakes the render loop if it waits for events
+        self.__redraw_requested.set()
+        if self.__window is not None:
+            glfw.post_empty_event()
+
     def draw_content(self):
         pass
 
@@ -126,9 +156,15 @@ class ImGuiApp:
             exit(1)
 
         while not glfw.window_should_close(self.__window) and not InterruptHandler.interrupted:
-            glfw.poll_events()
+            self.__wait_events()
+
+            frame_start = time.monotonic()
+            cpu_start = time.thread_time()
             self.__renderer.process_inputs()
 
+            # Events other threads published for the GUI since the last frame
+            Bus.dispatch_gui()
+
             imgui.new_frame()
 
             self._update()
@@ -144,16 +180,57 @@ class ImGuiApp:
             self.__renderer.render(imgui.get_draw_data())
             glfw.swap_buffers(self.__window)
 
+            self.__update_stats(time.thread_time() - cpu_start)
+            if imgui.is_any_mouse_down():
+                self.__active_frames = ImGuiApp.ACTIVE_FRAMES
+            if self._max_ui_fps:
+                time.sleep(max(0.0, frame_start + 1 / self._max_ui_fps - time.monotonic()))
+
         self.__shutdown()
 
+    def __wait_events(self):
+        if self.__active_frames > 0 or self.__redraw_requested.is_set() or self._needs_redraw():
+            glfw.poll_events()
+            self.__active_frames = max(0, self.__active_frames - 1)
+        else:
+            # Idle, sleeps until input or a redraw request; woken without a request means input
+            glfw.wait_events()
+            if not self.__redraw_requested.is_set():
+                self.__active_frames = ImGuiApp.ACTIVE_FRAMES
+        self.__redraw_requested.clear()
+
+    def __update_stats(self, cpu_time: float):
+        self.__stats_frames += 1
+        self.__stats_cpu_time += cpu_time
+        elapsed = time.monotonic() - self.__stats_start
+        if elapsed >= ImGuiApp.STATS_INTERVAL:
+            Bus.publish("update-render-stats", int(self.__stats_frames / elapsed),
+                        self.__stats_cpu_time / elapsed * 1000)
+            self.__stats_start = time.monotonic()
+            self.__stats_frames = 0
+            self.__stats_cpu_time = 0.0
+
 
 class InterruptHandler:
     interrupted = False
 
     @staticmethod
-    def signal():
+    def signal(wakeup=None):
         signal.signal(signal.SIGINT, InterruptHandler.exit)
         signal.signal(signal.SIGTERM, InterruptHandler.exit)
+        if wakeup is None:
+            return
+        # Python handlers only run once the main thread is back from C: an idle render loop blocked in
+        # glfw.wait_events is woken from another thread, told by the interpreter through the wakeup fd
+        read_fd, write_fd = os.pipe()
+        os.set_blocking(write_fd, False)
+        signal.set_wakeup_fd(write_fd)
+        threading.Thread(target=InterruptHandler._wake_on_signal, args=(read_fd, wakeup), daemon=True).start()
+
+    @staticmethod
+    def _wake_on_signal(read_fd: int, wakeup):
+        while os.read(read_fd, 64):
+            wakeup()
 
     @staticmethod
     def exit(*args):
@@ -3,6 +3,7 @@ from pathlib import Path
 import imgui
 
 from TrackerContest.core import Bus
+from TrackerContest.core.video import FrameSource
 from TrackerContest.gui.objects.panels import Panel
 
 
@@ -49,7 +50,8 @@ class FilesControl(Panel):
 
         if changed_ip:
             input_path = Path(self._input_path)
-            if input_path.exists() and input_path.suffix == ".mp4":
+            # A video file or a directory of frame images
+            if FrameSource.is_supported(str(input_path)):
                 Bus.publish("init-video", self._input_path)
                 self._input_status = f"Video path: {self._input_path}"
             else:
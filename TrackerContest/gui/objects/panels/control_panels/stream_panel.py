@@ -13,14 +13,28 @@ class StreamControl(Panel):
         self._in_tracking = True
         self._trackers: Dict = {}
 
-        Bus.subscribe("set-init-fps", self.fps)
-        Bus.subscribe("connected-new-tracker", self._connected_new_tracker)
-        Bus.subscribe("remove-tracker", self._removed_tracker)
-        Bus.subscribe("update-tracker-fps", self._update_fps)
-        Bus.subscribe("update-real-fps", self._update_real_fps)
+        # Published from decoder and network threads, delivered in the GUI thread between UI frames;
+        # only the latest fps per tracker per UI frame
+        Bus.subscribe("set-init-fps", self.fps, policy=Bus.GUI)
+        Bus.subscribe("connected-new-tracker", self._connected_new_tracker, policy=Bus.GUI)
+        Bus.subscribe("remove-tracker", self._removed_tracker, policy=Bus.GUI)
+        Bus.subscribe("update-tracker-fps", self._update_fps, policy=Bus.GUI, coalesce=lambda name, fps: name)
+        Bus.subscribe("update-real-fps", self._update_real_fps, policy=Bus.GUI, coalesce=True)
+        Bus.subscribe("update-render-stats", self._update_render_stats)
+        Bus.subscribe("update-player-stats", self._update_player_stats, policy=Bus.GUI, coalesce=True)
+        Bus.subscribe("update-frame-pool-stats", self._update_frame_pool_stats, policy=Bus.GUI, coalesce=True)
 
         self._fps = 0
         self._real_fps = 0
+        self._ui_fps = 0
+        self._render_cpu_ms = 0.0
+        self._player_fps = 0.0
+        self._player_target_fps = 0
+        self._dropped_frames = 0
+        self._underruns = 0
+        self._pool_buffers = 0
+        self._pool_nbytes = 0
+        self._pool_hit_rate = 0.0
         self._brightness = 1
 
     def fps(self, fps: int):
@@ -38,6 +52,12 @@ class StreamControl(Panel):
         imgui.set_window_font_scale(1.7)
         imgui.dummy(5, 5)
         imgui.text(f"Real FPS: {self._real_fps}")
+        imgui.set_window_font_scale(1.2)
+        imgui.text(f"UI: {self._ui_fps} fps, {self._render_cpu_ms:.0f} ms CPU/s")
+        imgui.text(f"Player: {self._player_fps:.1f}/{self._player_target_fps} fps, {self._dropped_frames} dropped, "
+                   f"{self._underruns} underruns")
+        imgui.text(f"Frame pool: {self._pool_buffers} buffers, {self._pool_nbytes / (1 << 20):.0f} MB, "
+                   f"{self._pool_hit_rate:.0%} reused")
 
         imgui.dummy(5, 5)
         imgui.set_window_font_scale(2)
@@ -65,7 +85,25 @@ class StreamControl(Panel):
         self._trackers.pop(name)
 
     def _update_fps(self, name: str, fps: int):
-        self._trackers[name]["fps"] = fps
+        # May arrive after the tracker was removed
+        if name in self._trackers:
+            self._trackers[name]["fps"] = fps
 
     def _update_real_fps(self, fps: int):
         self._real_fps = fps
+
+    def _update_render_stats(self, ui_fps: int, cpu_ms: float):
+        # Render loop frames and CPU time spent rendering, per second
+        self._ui_fps = ui_fps
+        self._render_cpu_ms = cpu_ms
+
+    def _update_player_stats(self, achieved_fps: float, target_fps: int, dropped_frames: int, underruns: int):
+        self._player_fps = achieved_fps
+        self._player_target_fps = target_fps
+        self._dropped_frames = dropped_frames
+        self._underruns = underruns
+
+    def _update_frame_pool_stats(self, n_buffers: int, nbytes: int, hit_rate: float):
+        self._pool_buffers = n_buffers
+        self._pool_nbytes = nbytes
+        self._pool_hit_rate = hit_rate
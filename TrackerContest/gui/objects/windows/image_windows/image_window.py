@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import math
+
 import imgui
 
 from TrackerContest.gui.objects.windows import Window
@@ -16,40 +18,60 @@ class ImageWindow(Window):
 
         self._image_texture = ImTex(1, 1)
 
+        # The texture may hold a downscaled or cropped copy of the image: image size in pixels, and the
+        # (x, y, width, height) region of the image the texture covers
+        self._image_size: tuple[int, int] = (1, 1)
+        self._texture_rect: tuple[int, int, int, int] = (0, 0, 1, 1)
+
+        # Tracker bboxes drawn over the image: (bbox, color, label), in image pixels
+        self._bboxes: list = []
+        self._bbox_thickness = 2
+
     @property
-    def _texture_width(self):
-        return self._image_texture.get_size().x
+    def _image_width(self):
+        return self._image_size[0]
 
     @property
-    def _texture_height(self):
-        return self._image_texture.get_size().y
+    def _image_height(self):
+        return self._image_size[1]
 
     @staticmethod
     def _uv_size(window: ImageWindow) -> imgui.Vec2:
-        uv_width = window._texture_width * (window._uv1[0] - window._uv0[0])
-        uv_height = window._texture_height * (window._uv1[1] - window._uv0[1])
+        uv_width = window._image_width * (window._uv1[0] - window._uv0[0])
+        uv_height = window._image_height * (window._uv1[1] - window._uv0[1])
         return imgui.Vec2(uv_width, uv_height)
 
     @staticmethod
     def _uv_offset(window: ImageWindow) -> imgui.Vec2:
-        uv_offset_x = window._uv0[0] * window._texture_width
-        uv_offset_y = window._uv0[1] * window._texture_height
+        uv_offset_x = window._uv0[0] * window._image_width
+        uv_offset_y = window._uv0[1] * window._image_height
         return imgui.Vec2(uv_offset_x, uv_offset_y)
 
+    @staticmethod
+    def _image_rect(window: ImageWindow) -> tuple[imgui.Vec2, imgui.Vec2]:
+        # Position and size of the image in the window, fitted keeping the aspect ratio
+        scale = min(window.size.x / window._image_width, window.size.y / window._image_height)
+        image_width = window._image_width * scale
+        image_height = window._image_height * scale
+        return (imgui.Vec2(window.size.x / 2 - image_width / 2, window.size.y / 2 - image_height / 2),
+                imgui.Vec2(image_width, image_height))
+
     @staticmethod
     def image2window(window: ImageWindow, image_x: float, image_y: float):
         uv_size = ImageWindow._uv_size(window)
         uv_offset = ImageWindow._uv_offset(window)
-        window_x = (image_x - uv_offset.x) / uv_size.x * window._width
-        window_y = (image_y - uv_offset.y) / uv_size.y * window._height
+        image_pos, image_size = ImageWindow._image_rect(window)
+        window_x = image_pos.x + (image_x - uv_offset.x) / uv_size.x * image_size.x
+        window_y = image_pos.y + (image_y - uv_offset.y) / uv_size.y * image_size.y
         return imgui.Vec2(window_x, window_y)
 
     @staticmethod
     def window2image(window: ImageWindow, window_x: float, window_y: float):
         uv_size = ImageWindow._uv_size(window)
         uv_offset = ImageWindow._uv_offset(window)
-        image_x = window_x / window._width * uv_size.x + uv_offset.x
-        image_y = window_y / window._height * uv_size.y + uv_offset.y
+        image_pos, image_size = ImageWindow._image_rect(window)
+        image_x = (window_x - image_pos.x) / image_size.x * uv_size.x + uv_offset.x
+        image_y = (window_y - image_pos.y) / image_size.y * uv_size.y + uv_offset.y
         return imgui.Vec2(image_x, image_y)
 
     @staticmethod
@@ -62,15 +84,36 @@ class ImageWindow(Window):
         window_position = ImageWindow.image2window(window, image_x, image_y)
         return Window.window2screen(window, window_position.x, window_position.y)
 
-    def upload_image(self, image):
+    def upload_image(self, image, image_size: tuple[int, int] = None, rect: tuple[int, int, int, int] = None):
+        # image is the whole image, or the region rect of an image_size image, possibly downscaled
+        self._image_size = image_size or (image.shape[1], image.shape[0])
+        self._texture_rect = rect or (0, 0) + self._image_size
         self._init_texture(image)
 
+    def display_view(self, image_width: int, image_height: int) -> tuple[int, int, int, int, int, int]:
+        # (x0, y0, x1, y1, width, height): the region of the image visible at the current zoom and the size in
+        # screen pixels worth uploading for it, never more than the region itself
+        x0 = min(max(0, math.floor(self._uv0.x * image_width)), image_width - 1)
+        y0 = min(max(0, math.floor(self._uv0.y * image_height)), image_height - 1)
+        x1 = max(min(image_width, math.ceil(self._uv1.x * image_width)), x0 + 1)
+        y1 = max(min(image_height, math.ceil(self._uv1.y * image_height)), y0 + 1)
+
+        _, image_size = ImageWindow._image_rect(self)
+        fb_scale = imgui.get_io().display_fb_scale
+        scale = min(1.0, max(image_size.x * fb_scale[0] / (x1 - x0), image_size.y * fb_scale[1] / (y1 - y0)))
+        return x0, y0, x1, y1, max(1, round((x1 - x0) * scale)), max(1, round((y1 - y0) * scale))
+
+    def set_bboxes(self, bboxes: list):
+        # Drawn with the next window draw, the image itself is never modified
+        self._bboxes = bboxes
+
     def _init_texture(self, image):
-        if image.shape[1] != self._texture_width or image.shape[0] != self._texture_height:
+        texture_size = self._image_texture.get_size()
+        if image.shape[1] != texture_size.x or image.shape[0] != texture_size.y:
             self._image_texture.release_tex_id()
             self._image_texture = ImTex(image.shape[1], image.shape[0])
 
-        self._image_texture.upload_data(image.data)
+        self._image_texture.upload_data(image)
 
     def _init_window(self):
         # display_size = imgui.get_io().display_size
@@ -85,9 +128,9 @@ class ImageWindow(Window):
         # self._y = display_size[1] / 2 - self._height / 2
 
         display_size = imgui.get_io().display_size
-        aspect_ratio_y = display_size[1] / self._texture_height
+        aspect_ratio_y = display_size[1] / self._image_height
 
-        self._height = self._texture_height * aspect_ratio_y
+        self._height = self._image_height * aspect_ratio_y
         self._width = 2 / 3 * display_size[0]
         self._x = 0
         self._y = display_size[1] / 2 - self._height / 2
@@ -108,16 +151,41 @@ class ImageWindow(Window):
         imgui.pop_style_var(2)
 
     def _draw_content(self):
-        aspect_ratio_x = self.size.x / self._texture_width
-        aspect_ratio_y = self.size.y / self._texture_height
+        image_pos, image_size = ImageWindow._image_rect(self)
+
+        imgui.set_cursor_pos((image_pos.x, image_pos.y))
+
+        # Image UVs to UVs of the texture, which covers _texture_rect of the image
+        x, y, width, height = self._texture_rect
+        uv0 = ((self._uv0.x * self._image_width - x) / width, (self._uv0.y * self._image_height - y) / height)
+        uv1 = ((self._uv1.x * self._image_width - x) / width, (self._uv1.y * self._image_height - y) / height)
+
+        imgui.image(self._image_texture.get_tex_id(), image_size.x, image_size.y, uv0, uv1)
+
+    def _draw_overlay(self):
+        self._draw_bboxes()
+
+    def _draw_bboxes(self):
+        if not self._bboxes:
+            return
 
-        image_width = self._texture_width * min(aspect_ratio_x, aspect_ratio_y)
-        image_height = self._texture_height * min(aspect_ratio_x, aspect_ratio_y)
+        draw_list = imgui.get_window_draw_list()
 
-        image_pos_x = self.size.x / 2 - image_width / 2
-        image_pos_y = self.size.y / 2 - image_height / 2
+        # Boxes of a zoomed in image are cut at the image edges
+        image_pos, image_size = ImageWindow._image_rect(self)
+        clip_min = self.window2screen(self, image_pos.x, image_pos.y)
+        clip_max = self.window2screen(self, image_pos.x + image_size.x, image_pos.y + image_size.y)
+        draw_list.push_clip_rect(clip_min.x, clip_min.y, clip_max.x, clip_max.y, True)
 
-        imgui.set_cursor_pos((image_pos_x, image_pos_y))
+        for bbox, color, label in self._bboxes:
+            if bbox is None:
+                continue
+            x, y, w, h = bbox[:4]
+            p1 = self.image2screen(self, x, y)
+            p2 = self.image2screen(self, x + w, y + h)
+            color_u32 = imgui.get_color_u32_rgba(color[0], color[1], color[2], 1.0)
+            draw_list.add_rect(p1.x, p1.y, p2.x, p2.y, color_u32, thickness=self._bbox_thickness)
+            if label:
+                draw_list.add_text(p1.x, p1.y - imgui.get_text_line_height(), color_u32, label)
 
-        imgui.image(self._image_texture.get_tex_id(), image_width, image_height,
-                    (self._uv0.x, self._uv0.y), (self._uv1.x, self._uv1.y))
+        draw_list.pop_clip_rect()
@@ -54,8 +54,8 @@ class ZoomImageWindow(ImageWindow):
         anchor_pos_screen = imgui.get_mouse_pos()
         anchor_pos_texture = self.screen2image(self, anchor_pos_screen.x, anchor_pos_screen.y)
 
-        anchor_pos_texture_plane = imgui.Vec2(anchor_pos_texture.x / self._texture_width,
-                                              anchor_pos_texture.y / self._texture_height)
+        anchor_pos_texture_plane = imgui.Vec2(anchor_pos_texture.x / self._image_width,
+                                              anchor_pos_texture.y / self._image_height)
 
         anchor_pos_uv_plane = imgui.Vec2((anchor_pos_texture_plane[0] - self._uv0[0]) / (self._uv1[0] - self._uv0[0]),
                                          (anchor_pos_texture_plane[1] - self._uv0[1]) / (self._uv1[1] - self._uv0[1]))
@@ -86,6 +86,8 @@ class ZoomImageWindow(ImageWindow):
         self.__touch_zooming()
 
     def _draw_overlay(self):
+        super()._draw_overlay()
+
         if not self._is_draw_navigation or self._current_scale == self._min_scale:
             return
 
@@ -1,2 +1,3 @@
 from .imtex import ImTex
 from .drawer import Drawer
+from .display_proxy import DisplayProxy
@@ -0,0 +1,84 @@
+import threading
+from typing import Optional, Any, Callable
+
+import cv2
+import numpy as np
+
+from TrackerContest.core.video import FramePool, FrameSlot
+
+
+class DisplayProxy:
+    # Prepares what the image window uploads on a worker thread: the visible region of a frame, downscaled to
+    # the size it takes on screen. Only the newest request is processed, results are read from a FrameSlot
+    def __init__(self, frame_pool: Optional[FramePool] = None, on_result: Optional[Callable] = None):
+        self._frame_pool = frame_pool
+        self._on_result = on_result
+        self._cond = threading.Condition()
+        self._request: Optional[tuple] = None
+        self._running = True
+
+        # Results: (proxy image, (info, image size, region of the image))
+        self._results = FrameSlot()
+
+        self._thread = threading.Thread(target=self._process, name="DisplayProxy", daemon=True)
+        self._thread.start()
+
+    def submit(self, frame: np.ndarray, info: Any, view: tuple):
+        # Takes over a frame retained in the pool, it is released once processed or replaced by a newer request
+        with self._cond:
+            previous, self._request = self._request, (frame, info, view)
+            self._cond.notify()
+        if previous is not None and self._frame_pool is not None:
+            self._frame_pool.release(previous[0])
+
+    def get(self, generation: int = -1) -> tuple:
+        return self._results.get(generation)
+
+    def close(self):
+        # Joined: once closed, on_result is never called again, e.g. after the window is gone
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+
+    @staticmethod
+    def make_proxy(frame: np.ndarray, view: tuple) -> np.ndarray:
+        x0, y0, x1, y1, width, height = view
+        region = frame[y0:y1, x0:x1]
+        if (width, height) == (x1 - x0, y1 - y0):
+            # Native resolution; copied, the frame goes back to the pool
+            return region.copy()
+        # Area averaging is fast for integer factors only: shrink by the integer part first, the rest linear
+        factor = min(region.shape[1] // width, region.shape[0] // height)
+        if factor >= 2:
+            region = cv2.resize(region, (region.shape[1] // factor, region.shape[0] // factor),
+                                interpolation=cv2.INTER_AREA)
+        return cv2.resize(region, (width, height), interpolation=cv2.INTER_LINEAR)
+
+    def _process(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._request is not None or not self._running)
+                if not self._running:
+                    break
+                (frame, info, view), self._request = self._request, None
+
+            image_height, image_width = frame.shape[:2]
+            x0, y0, x1, y1 = view[:4]
+            try:
+                proxy = DisplayProxy.make_proxy(frame, view)
+            except Exception as e:
+                print(f"[Error] Failed display proxy: {e}")
+                continue
+            finally:
+                if self._frame_pool is not None:
+                    self._frame_pool.release(frame)
+            self._results.put(proxy, (info, (image_width, image_height), (x0, y0, x1 - x0, y1 - y0)))
+            if self._on_result is not None:
+                self._on_result()
+
+        with self._cond:
+            request, self._request = self._request, None
+        if request is not None and self._frame_pool is not None:
+            self._frame_pool.release(request[0])
@@ -1,5 +1,7 @@
+import ctypes
 import enum
 
+import numpy as np
 import OpenGL.GL as gl
 
 import imgui
@@ -12,8 +14,13 @@ class ImTex:
         BGR = gl.GL_BGR
         BGRA = gl.GL_BGRA
 
+    # Uploads go through a ring of pixel buffer objects: the next frame is copied into one while the
+    # transfer from the previous one is still in flight. 0 uploads from client memory directly
+    PIXEL_BUFFERS = 3
+
     def __init__(self, width: int, height: int,
-                 src_format: TexFormat = TexFormat.RGB, dst_format: TexFormat = TexFormat.RGB, data=None):
+                 src_format: TexFormat = TexFormat.RGB, dst_format: TexFormat = TexFormat.RGB, data=None,
+                 pixel_buffers: int = PIXEL_BUFFERS):
 
         self.__tex_size: imgui.Vec2 = imgui.Vec2(width, height)
 
@@ -21,6 +28,8 @@ class ImTex:
 
         gl.glBindTexture(gl.GL_TEXTURE_2D, self.__tex_id)
         gl.glPixelStorei(gl.GL_UNPACK_ROW_LENGTH, 0)
+        # Rows of RGB frames are not 4 byte aligned for every width
+        gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT, 1)
         gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER, gl.GL_LINEAR)
         gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER, gl.GL_LINEAR)
         gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, src_format.value, width, height, 0, dst_format.value,
@@ -28,13 +37,54 @@ class ImTex:
 
         self.check_errors()
 
+        # Created with the first upload, once the frame size in bytes is known
+        self.__pixel_buffers_count = pixel_buffers
+        self.__pixel_buffers: list = []
+        self.__pixel_buffer_size = 0
+        self.__pixel_buffer_index = 0
+
+    @property
+    def streaming(self) -> bool:
+        # True once uploads go through pixel buffer objects
+        return bool(self.__pixel_buffers)
+
     def release_tex_id(self):
         gl.glDeleteTextures(1, self.__tex_id)
+        self.__release_pixel_buffers()
 
     def upload_data(self, data, tex_format: TexFormat = TexFormat.RGB):
+        data = np.ascontiguousarray(data)
         gl.glBindTexture(gl.GL_TEXTURE_2D, self.__tex_id)
-        gl.glTexSubImage2D(gl.GL_TEXTURE_2D, 0, 0, 0, self.__tex_size.x, self.__tex_size.y,
-                           tex_format.value, gl.GL_UNSIGNED_BYTE, data)
+
+        if data.nbytes != self.__pixel_buffer_size:
+            self.__init_pixel_buffers(data.nbytes)
+        if not self.__pixel_buffers:
+            gl.glTexSubImage2D(gl.GL_TEXTURE_2D, 0, 0, 0, self.__tex_size.x, self.__tex_size.y,
+                               tex_format.value, gl.GL_UNSIGNED_BYTE, data)
+            self.check_errors()
+            return
+
+        pixel_buffer = self.__pixel_buffers[self.__pixel_buffer_index]
+        self.__pixel_buffer_index = (self.__pixel_buffer_index + 1) % len(self.__pixel_buffers)
+
+        gl.glBindBuffer(gl.GL_PIXEL_UNPACK_BUFFER, pixel_buffer)
+        # Orphaning the storage lets the driver hand out fresh memory instead of waiting for a transfer
+        # still reading this buffer
+        gl.glBufferData(gl.GL_PIXEL_UNPACK_BUFFER, data.nbytes, None, gl.GL_STREAM_DRAW)
+        pointer = gl.glMapBufferRange(gl.GL_PIXEL_UNPACK_BUFFER, 0, data.nbytes,
+                                      gl.GL_MAP_WRITE_BIT | gl.GL_MAP_INVALIDATE_BUFFER_BIT)
+        if pointer:
+            ctypes.memmove(pointer, data.ctypes.data, data.nbytes)
+            gl.glUnmapBuffer(gl.GL_PIXEL_UNPACK_BUFFER)
+            # Source is an offset into the bound buffer, the copy to the texture runs asynchronously
+            gl.glTexSubImage2D(gl.GL_TEXTURE_2D, 0, 0, 0, self.__tex_size.x, self.__tex_size.y,
+                               tex_format.value, gl.GL_UNSIGNED_BYTE, ctypes.c_void_p(0))
+            gl.glBindBuffer(gl.GL_PIXEL_UNPACK_BUFFER, 0)
+        else:
+            gl.glBindBuffer(gl.GL_PIXEL_UNPACK_BUFFER, 0)
+            self.__release_pixel_buffers()
+            gl.glTexSubImage2D(gl.GL_TEXTURE_2D, 0, 0, 0, self.__tex_size.x, self.__tex_size.y,
+                               tex_format.value, gl.GL_UNSIGNED_BYTE, data)
         self.check_errors()
 
     def get_tex_id(self) -> gl.GLuint64:
@@ -43,6 +93,31 @@ class ImTex:
     def get_size(self) -> imgui.Vec2:
         return self.__tex_size
 
+    def __init_pixel_buffers(self, size: int):
+        self.__release_pixel_buffers()
+        self.__pixel_buffer_size = size
+        # Pixel buffer objects and buffer mapping are core since OpenGL 3.0
+        if not self.__pixel_buffers_count or not bool(gl.glGenBuffers) or not bool(gl.glMapBufferRange):
+            return
+        try:
+            buffers = gl.glGenBuffers(self.__pixel_buffers_count)
+            self.__pixel_buffers = [int(buffer) for buffer in np.atleast_1d(buffers)]
+            for pixel_buffer in self.__pixel_buffers:
+                gl.glBindBuffer(gl.GL_PIXEL_UNPACK_BUFFER, pixel_buffer)
+                gl.glBufferData(gl.GL_PIXEL_UNPACK_BUFFER, size, None, gl.GL_STREAM_DRAW)
+            gl.glBindBuffer(gl.GL_PIXEL_UNPACK_BUFFER, 0)
+            self.check_errors()
+        except (gl.GLError, ValueError, MemoryError) as e:
+            print(f"[INFO] Pixel buffer uploads unavailable, uploading directly: {e}")
+            self.__release_pixel_buffers()
+
+    def __release_pixel_buffers(self):
+        if self.__pixel_buffers:
+            gl.glDeleteBuffers(len(self.__pixel_buffers), self.__pixel_buffers)
+        self.__pixel_buffers = []
+        self.__pixel_buffer_size = 0
+        self.__pixel_buffer_index = 0
+
     @staticmethod
     def check_errors():
         match gl.glGetError():
@@ -54,3 +129,59 @@ class ImTex:
                 raise ValueError("Invalid operation")
             case gl.GL_OUT_OF_MEMORY:
                 raise MemoryError("Out of memory")
+
+
+if __name__ == "__main__":
+    # Upload benchmark, direct vs pixel buffer streaming. Runs on CPU-only machines with Mesa's software
+    # renderer: LIBGL_ALWAYS_SOFTWARE=1 python -m TrackerContest.gui.utils.imtex --width 3840 --height 2160
+    import argparse
+    import time
+
+    import glfw
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--width", type=int, default=3840)
+    parser.add_argument("--height", type=int, default=2160)
+    parser.add_argument("--frames", type=int, default=200)
+    args = parser.parse_args()
+
+    if not glfw.init():
+        print("[ERROR] Could not initialize OpenGL context")
+        exit(1)
+    glfw.window_hint(glfw.VISIBLE, glfw.FALSE)
+    glfw.window_hint(glfw.CONTEXT_VERSION_MAJOR, 3)
+    glfw.window_hint(glfw.CONTEXT_VERSION_MINOR, 3)
+    glfw.window_hint(glfw.OPENGL_PROFILE, glfw.OPENGL_CORE_PROFILE)
+    glfw.window_hint(glfw.OPENGL_FORWARD_COMPAT, gl.GL_TRUE)
+    window = glfw.create_window(64, 64, "ImTex benchmark", None, None)
+    if not window:
+        glfw.terminate()
+        print("[ERROR] Could not initialize Window")
+        exit(1)
+    glfw.make_context_current(window)
+    print(f"[INFO] {gl.glGetString(gl.GL_RENDERER).decode()}, {args.width}x{args.height}, {args.frames} frames")
+
+    frames = [np.random.randint(0, 256, (args.height, args.width, 3), dtype=np.uint8) for _ in range(4)]
+    for name, pixel_buffers in (("direct", 0), ("pbo x2", 2), ("pbo x3", 3)):
+        texture = ImTex(args.width, args.height, pixel_buffers=pixel_buffers)
+        texture.upload_data(frames[0])
+        gl.glFinish()
+
+        # Time the render thread spends in upload_data, then until the GPU has caught up
+        upload_time = 0.0
+        start = time.perf_counter()
+        for i in range(args.frames):
+            upload_start = time.perf_counter()
+            texture.upload_data(frames[i % len(frames)])
+            upload_time += time.perf_counter() - upload_start
+        gl.glFinish()
+        total_time = time.perf_counter() - start
+
+        mb_per_frame = frames[0].nbytes / (1 << 20)
+        print(f"[INFO] {name:>7}{' (fallback)' if pixel_buffers and not texture.streaming else ''}: "
+              f"{upload_time / args.frames * 1000:.2f} ms per upload call, "
+              f"{args.frames / total_time:.1f} fps, {mb_per_frame * args.frames / total_time:.0f} MB/s")
+        texture.release_tex_id()
+
+    glfw.destroy_window(window)
+    glfw.terminate()